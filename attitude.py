@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+"""Attitude conversions for single samples and for N samples per call
+
+Usage: python attitude.py [-n samples] [-t tolerance]
+
+    -n  Number of random attitudes of the checks. Default is 100000.
+
+    -t  Largest error of a check that passes. Default is 1e-9.
+
+Runs the round-trip checks of the array functions against the scalar
+reference versions and prints their errors and throughput. The exit status
+is 1 if a check fails.
+
+Quaternions are [w, x, y, z], Euler angles roll, pitch, yaw (rotation about
+z, then y, then x, as logged by sdlog2) and rotation matrices rotate from the
+body to the local frame. The *_array functions take N x 4 quaternions, N x 3
+angles or N x 3 x 3 matrices. Quaternions returned by rot_to_quat have w >= 0."""
+
+from __future__ import division, print_function
+
+import sys, time
+from collections import OrderedDict
+from math import acos, asin, atan2, cos, sin, sqrt
+import numpy as np
+
+__author__ = "Roman Bapst"
+
+# largest error of a passing check, the conversions are exact up to rounding
+TOLERANCE = 1e-9
+
+# scalar reference versions
+
+def quat_to_rot(q):
+    #compute rotation matrix from quaternion
+    q0, q1, q2, q3 = q
+    R = np.zeros((3,3))
+    R[0,0] = q0 * q0 + q1 * q1 - q2 * q2 - q3 * q3
+    R[0,1] = 2 * q1 * q2 - 2 * q0 * q3
+    R[0,2] = 2 * q1 * q3 + 2 * q0 * q2
+    R[1,0] = 2 * q1 * q2 + 2 * q0 * q3
+    R[1,1] = q0 * q0 - q1 * q1 + q2 * q2 - q3 * q3
+    R[1,2] = 2 * q2 * q3 - 2 * q0 * q1
+    R[2,0] = 2 * q1 * q3 - 2 * q0 * q2
+    R[2,1] = 2 * q2 * q3 + 2 * q0 * q1
+    R[2,2] = q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3
+    return R
+
+def rot_to_quat(R):
+    # Shepperd's method: start from the largest of w, x, y, z, so that the
+    # square root is never taken of a small number and the signs follow
+    tr = R[0][0] + R[1][1] + R[2][2]
+    if tr >= R[0][0] and tr >= R[1][1] and tr >= R[2][2]:
+        s = 2 * sqrt(1.0 + tr)
+        q = [s / 4, (R[2][1] - R[1][2]) / s, (R[0][2] - R[2][0]) / s, (R[1][0] - R[0][1]) / s]
+    elif R[0][0] >= R[1][1] and R[0][0] >= R[2][2]:
+        s = 2 * sqrt(1.0 + R[0][0] - R[1][1] - R[2][2])
+        q = [(R[2][1] - R[1][2]) / s, s / 4, (R[0][1] + R[1][0]) / s, (R[0][2] + R[2][0]) / s]
+    elif R[1][1] >= R[2][2]:
+        s = 2 * sqrt(1.0 - R[0][0] + R[1][1] - R[2][2])
+        q = [(R[0][2] - R[2][0]) / s, (R[0][1] + R[1][0]) / s, s / 4, (R[1][2] + R[2][1]) / s]
+    else:
+        s = 2 * sqrt(1.0 - R[0][0] - R[1][1] + R[2][2])
+        q = [(R[1][0] - R[0][1]) / s, (R[0][2] + R[2][0]) / s, (R[1][2] + R[2][1]) / s, s / 4]
+    if q[0] < 0:
+        q = [-v for v in q]
+    return q
+
+def rpy_to_quat(roll, pitch, yaw):
+    # compute quaternion from XYZ fixed Euler angles
+    # RPY = gamma, beta, alpha
+    #     = phi, theta, psi
+    cg, sg = cos(roll / 2), sin(roll / 2)
+    cb, sb = cos(pitch / 2), sin(pitch / 2)
+    ca, sa = cos(yaw / 2), sin(yaw / 2)
+    return [cg * cb * ca + sg * sb * sa,
+            sg * cb * ca - cg * sb * sa,
+            cg * sb * ca + sg * cb * sa,
+            cg * cb * sa - sg * sb * ca]
+
+def rpy_to_rot(roll, pitch, yaw):
+    cg, sg = cos(roll), sin(roll)
+    cb, sb = cos(pitch), sin(pitch)
+    ca, sa = cos(yaw), sin(yaw)
+    R = np.zeros((3,3))
+    R[0,0] = ca * cb
+    R[0,1] = ca * sb * sg - sa * cg
+    R[0,2] = ca * sb * cg + sa * sg
+    R[1,0] = sa * cb
+    R[1,1] = sa * sb * sg + ca * cg
+    R[1,2] = sa * sb * cg - ca * sg
+    R[2,0] = -sb
+    R[2,1] = cb * sg
+    R[2,2] = cb * cg
+    return R
+
+def quat_to_rpy(q):
+    # roll, pitch, yaw of a unit quaternion, pitch in [-pi/2, pi/2]
+    q0, q1, q2, q3 = q
+    roll = atan2(2 * (q0 * q1 + q2 * q3), 1 - 2 * (q1 * q1 + q2 * q2))
+    pitch = asin(max(-1.0, min(1.0, 2 * (q0 * q2 - q3 * q1))))
+    yaw = atan2(2 * (q0 * q3 + q1 * q2), 1 - 2 * (q2 * q2 + q3 * q3))
+    return [roll, pitch, yaw]
+
+def slerp(q0, q1, t):
+    # spherical linear interpolation from q0 (t = 0) to q1 (t = 1) along the shorter arc
+    dot = sum(a * b for a, b in zip(q0, q1))
+    if dot < 0:
+        q1 = [-v for v in q1]
+        dot = -dot
+    if dot > 0.9995:
+        # nearly equal, normalized linear interpolation
+        q = [a + t * (b - a) for a, b in zip(q0, q1)]
+    else:
+        theta = acos(dot)
+        w0 = sin((1 - t) * theta) / sin(theta)
+        w1 = sin(t * theta) / sin(theta)
+        q = [w0 * a + w1 * b for a, b in zip(q0, q1)]
+    norm = sqrt(sum(v * v for v in q))
+    return [v / norm for v in q]
+
+# array versions
+
+def quat_to_rot_array(q):
+    # quat_to_rot for N x 4 quaternions, returns N x 3 x 3 matrices
+    q0, q1, q2, q3 = np.asarray(q, dtype=np.float64).T
+    R = np.empty((len(q0), 3, 3))
+    R[:,0,0] = q0 * q0 + q1 * q1 - q2 * q2 - q3 * q3
+    R[:,0,1] = 2 * q1 * q2 - 2 * q0 * q3
+    R[:,0,2] = 2 * q1 * q3 + 2 * q0 * q2
+    R[:,1,0] = 2 * q1 * q2 + 2 * q0 * q3
+    R[:,1,1] = q0 * q0 - q1 * q1 + q2 * q2 - q3 * q3
+    R[:,1,2] = 2 * q2 * q3 - 2 * q0 * q1
+    R[:,2,0] = 2 * q1 * q3 - 2 * q0 * q2
+    R[:,2,1] = 2 * q2 * q3 + 2 * q0 * q1
+    R[:,2,2] = q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3
+    return R
+
+def rot_to_quat_array(R):
+    # rot_to_quat for N x 3 x 3 matrices, returns N x 4 quaternions
+    R = np.asarray(R, dtype=np.float64)
+    r00, r11, r22 = R[:,0,0], R[:,1,1], R[:,2,2]
+    # Shepperd's case of every sample: 0 (w largest), 1 (x), 2 (y) or 3 (z)
+    case = np.argmax(np.column_stack([r00 + r11 + r22, r00, r11, r22]), axis=1)
+    q = np.empty((len(R), 4))
+    s = 2 * np.sqrt(np.maximum(1.0 + np.choose(case, [r00 + r11 + r22, r00 - r11 - r22,
+                                                      r11 - r00 - r22, r22 - r00 - r11]), 0.0))
+    d0 = R[:,2,1] - R[:,1,2]
+    d1 = R[:,0,2] - R[:,2,0]
+    d2 = R[:,1,0] - R[:,0,1]
+    s0 = R[:,0,1] + R[:,1,0]
+    s1 = R[:,0,2] + R[:,2,0]
+    s2 = R[:,1,2] + R[:,2,1]
+    q[:,0] = np.choose(case, [s / 4, d0 / s, d1 / s, d2 / s])
+    q[:,1] = np.choose(case, [d0 / s, s / 4, s0 / s, s1 / s])
+    q[:,2] = np.choose(case, [d1 / s, s0 / s, s / 4, s2 / s])
+    q[:,3] = np.choose(case, [d2 / s, s1 / s, s2 / s, s / 4])
+    q[q[:,0] < 0] *= -1
+    return q
+
+def rpy_to_quat_array(rpy):
+    # rpy_to_quat for N x 3 angles, returns N x 4 quaternions
+    half = 0.5 * np.asarray(rpy, dtype=np.float64)
+    cg, cb, ca = np.cos(half).T
+    sg, sb, sa = np.sin(half).T
+    return np.column_stack([cg * cb * ca + sg * sb * sa,
+                            sg * cb * ca - cg * sb * sa,
+                            cg * sb * ca + sg * cb * sa,
+                            cg * cb * sa - sg * sb * ca])
+
+def rpy_to_rot_array(rpy):
+    # rpy_to_rot for N x 3 angles, returns N x 3 x 3 matrices
+    rpy = np.asarray(rpy, dtype=np.float64)
+    cg, cb, ca = np.cos(rpy).T
+    sg, sb, sa = np.sin(rpy).T
+    R = np.empty((len(rpy), 3, 3))
+    R[:,0,0] = ca * cb
+    R[:,0,1] = ca * sb * sg - sa * cg
+    R[:,0,2] = ca * sb * cg + sa * sg
+    R[:,1,0] = sa * cb
+    R[:,1,1] = sa * sb * sg + ca * cg
+    R[:,1,2] = sa * sb * cg - ca * sg
+    R[:,2,0] = -sb
+    R[:,2,1] = cb * sg
+    R[:,2,2] = cb * cg
+    return R
+
+def quat_to_rpy_array(q):
+    # quat_to_rpy for N x 4 quaternions, returns N x 3 angles
+    q0, q1, q2, q3 = np.asarray(q, dtype=np.float64).T
+    return np.column_stack([np.arctan2(2 * (q0 * q1 + q2 * q3), 1 - 2 * (q1 * q1 + q2 * q2)),
+                            np.arcsin(np.clip(2 * (q0 * q2 - q3 * q1), -1.0, 1.0)),
+                            np.arctan2(2 * (q0 * q3 + q1 * q2), 1 - 2 * (q2 * q2 + q3 * q3))])
+
+def slerp_array(q0, q1, t):
+    # slerp of N x 4 quaternion pairs, t is a scalar or N fractions
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.array(q1, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64).reshape(-1, 1)
+    dot = np.sum(q0 * q1, axis=1)
+    q1[dot < 0] *= -1
+    dot = np.abs(dot).reshape(-1, 1)
+    theta = np.arccos(np.minimum(dot, 1.0))
+    near = dot > 0.9995
+    sin_theta = np.where(near, 1.0, np.sin(theta))
+    w0 = np.where(near, 1 - t, np.sin((1 - t) * theta) / sin_theta)
+    w1 = np.where(near, t, np.sin(t * theta) / sin_theta)
+    q = w0 * q0 + w1 * q1
+    return q / np.linalg.norm(q, axis=1)[:, np.newaxis]
+
+def random_rpy(n, seed=0):
+    # N x 3 angles covering all attitudes, pitch away from the +-90 degree singularity
+    rng = np.random.RandomState(seed)
+    return np.column_stack([rng.uniform(-np.pi, np.pi, n), rng.uniform(-1.5, 1.5, n), rng.uniform(-np.pi, np.pi, n)])
+
+def _quat_dist(a, b):
+    # largest difference of two quaternion arrays, q and -q are the same attitude
+    a = np.asarray(a)
+    b = np.asarray(b)
+    return float(np.max(np.minimum(np.abs(a - b).max(axis=1), np.abs(a + b).max(axis=1))))
+
+def check(n=100000, scalar_n=2000):
+    """Round-trip errors of the array functions and their agreement with the
+    scalar versions on n random attitudes (the scalar ones on the first
+    scalar_n), largest absolute error of every check"""
+    rpy = random_rpy(n)
+    q = rpy_to_quat_array(rpy)
+    R = quat_to_rot_array(q)
+    errors = OrderedDict()
+    errors["rpy_to_quat_vs_scalar"] = _quat_dist(q[:scalar_n], [rpy_to_quat(*a) for a in rpy[:scalar_n]])
+    errors["quat_to_rot_vs_scalar"] = float(np.abs(R[:scalar_n] - np.array([quat_to_rot(a) for a in q[:scalar_n]])).max())
+    errors["rpy_to_rot_vs_scalar"] = float(np.abs(rpy_to_rot_array(rpy[:scalar_n]) -
+                                                  np.array([rpy_to_rot(*a) for a in rpy[:scalar_n]])).max())
+    errors["rot_to_quat_vs_scalar"] = _quat_dist(rot_to_quat_array(R[:scalar_n]), [rot_to_quat(a) for a in R[:scalar_n]])
+    errors["quat_to_rpy_vs_scalar"] = float(np.abs(quat_to_rpy_array(q[:scalar_n]) -
+                                                   np.array([quat_to_rpy(a) for a in q[:scalar_n]])).max())
+    errors["rpy_to_rot_vs_quat_to_rot"] = float(np.abs(rpy_to_rot_array(rpy) - R).max())
+    errors["quat_rot_quat"] = _quat_dist(rot_to_quat_array(R), q)
+    errors["rpy_quat_rpy"] = float(np.abs(quat_to_rpy_array(q) - rpy).max())
+    # slerp: end points, unit norm and the midpoint against the scalar version
+    q1 = q[::-1]
+    errors["slerp_ends"] = max(_quat_dist(slerp_array(q, q1, 0.0), q), _quat_dist(slerp_array(q, q1, 1.0), q1))
+    mid = slerp_array(q[:scalar_n], q1[:scalar_n], 0.5)
+    errors["slerp_norm"] = float(np.abs(np.linalg.norm(slerp_array(q, q1, 0.3), axis=1) - 1).max())
+    errors["slerp_vs_scalar"] = _quat_dist(mid, [slerp(a, b, 0.5) for a, b in zip(q[:scalar_n], q1[:scalar_n])])
+    return errors
+
+def failed_checks(errors, tolerance=TOLERANCE):
+    # names of the checks of check() with an error above tolerance (or NaN)
+    return [name for name, error in errors.items() if not error <= tolerance]
+
+def throughput(n=100000, scalar_n=2000):
+    # samples per second of the array and scalar versions
+    rpy = random_rpy(n)
+    q = rpy_to_quat_array(rpy)
+    R = quat_to_rot_array(q)
+    q1 = q[::-1]
+    cases = [
+        ("rpy_to_quat", lambda: rpy_to_quat_array(rpy), lambda i: rpy_to_quat(*rpy[i])),
+        ("quat_to_rot", lambda: quat_to_rot_array(q), lambda i: quat_to_rot(q[i])),
+        ("rot_to_quat", lambda: rot_to_quat_array(R), lambda i: rot_to_quat(R[i])),
+        ("quat_to_rpy", lambda: quat_to_rpy_array(q), lambda i: quat_to_rpy(q[i])),
+        ("rpy_to_rot", lambda: rpy_to_rot_array(rpy), lambda i: rpy_to_rot(*rpy[i])),
+        ("slerp", lambda: slerp_array(q, q1, 0.5), lambda i: slerp(q[i], q1[i], 0.5)),
+    ]
+    result = OrderedDict()
+    for name, array_fn, scalar_fn in cases:
+        t0 = time.time()
+        array_fn()
+        t1 = time.time()
+        for i in range(scalar_n):
+            scalar_fn(i)
+        t2 = time.time()
+        result[name] = OrderedDict([("array_per_s", n / max(t1 - t0, 1e-9)),
+                                    ("scalar_per_s", scalar_n / max(t2 - t1, 1e-9))])
+    return result
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if len(argv) > 1 and argv[1] in ("-h", "--help"):
+        print(__doc__)
+        return
+    n = 100000
+    tolerance = TOLERANCE
+    opt = None
+    for arg in argv[1:]:
+        if opt != None:
+            if opt == "n":
+                n = int(arg)
+            elif opt == "t":
+                tolerance = float(arg)
+            opt = None
+        elif arg in ("-n", "-t"):
+            opt = arg[1]
+    errors = check(n)
+    failed = failed_checks(errors, tolerance)
+    for name, error in errors.items():
+        print("%-28s %10.3g %s" % (name, error, "FAIL" if name in failed else "ok"))
+    print("\n%-28s %14s %14s" % ("samples per second", "array", "scalar"))
+    for name, rates in throughput(n).items():
+        print("%-28s %14.4g %14.4g" % (name, rates["array_per_s"], rates["scalar_per_s"]))
+    if failed:
+        print("\n%i of %i checks failed: %s" % (len(failed), len(errors), ", ".join(failed)), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+"""Benchmark the log conversion and the viewers on a synthetic or given log
+
+Usage: python benchmark.py [-l log.bin] [-s size] [-c corruption] [-f frames] [-o results.json] [-b baseline.json]
+
+    -l  Benchmark this log instead of a synthetic one.
+
+    -s  Size of the synthetic log in MB. Default is 20.
+
+    -c  Corruption rate of the synthetic log, see sdlog2_gen.py. Default is 0.
+
+    -f  Number of frames rendered for the animation benchmark. Default is 200.
+
+    -o  Save the results as JSON.
+
+    -b  Compare the results with a previously saved JSON file.
+
+Every stage runs in its own process, so that the peak RSS is the one of the stage."""
+
+from __future__ import division, print_function
+
+import json, os, platform, resource, shutil, subprocess, sys, tempfile, time
+from collections import OrderedDict
+
+__author__ = "Roman Bapst"
+
+LOG_MSGS = ['TIME', 'ATT', 'LPOS', 'ATSP']
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / (1024 * 1024)
+    return rss / 1024
+
+class _NullHandler(object):
+    def __call__(self, msg_name, msg_labels, data):
+        pass
+
+def _decode(fn, msg_filter):
+    import sdlog2_dump
+    parser = sdlog2_dump.SDLog2Parser()
+    parser.setMsgFilter(msg_filter)
+    parser.setCorrectErrors(True)
+    parser.setMsgHandler(_NullHandler())
+    t0 = time.time()
+    parser.process(fn)
+    return time.time() - t0, sum(parser.getMsgCounts().values())
+
+def stage_decode(fn, frames):
+    # decode all messages without output
+    seconds, records = _decode(fn, [])
+    size = os.path.getsize(fn)
+    return OrderedDict([("seconds", seconds), ("records", records),
+                        ("mb_per_s", size / (1024 * 1024) / seconds), ("records_per_s", records / seconds)])
+
+def stage_csv(fn, frames):
+    # conversion as done by the viewers, csv writing is the difference to decoding only
+    import sdlog2_dump
+    msg_filter = [(msg_name, "*") for msg_name in LOG_MSGS]
+    decode_seconds, records = _decode(fn, list(msg_filter))
+    parser = sdlog2_dump.SDLog2Parser()
+    parser.setMsgFilter(list(msg_filter))
+    parser.setTimeMsg('TIME')
+    parser.setCorrectErrors(True)
+    parser.setFileName(fn.split('.')[0] + '.csv')
+    t0 = time.time()
+    parser.process(fn)
+    parser.setFileName(None)
+    seconds = time.time() - t0
+    size = os.path.getsize(fn)
+    return OrderedDict([("seconds", seconds), ("decode_seconds", decode_seconds), ("write_seconds", seconds - decode_seconds),
+                        ("mb_per_s", size / (1024 * 1024) / seconds), ("records_per_s", records / seconds)])
+
+def stage_columns(fn, frames):
+    # out-of-core columnar decoding, peak rss should not depend on the log size
+    import sdlog2_columns
+    out_dir = fn.split('.')[0] + '.columns'
+    t0 = time.time()
+    stats = sdlog2_columns.write_columns(fn, out_dir, correct_errors=True)
+    seconds = time.time() - t0
+    records = sum(msg["count"] for msg in stats.values())
+    size = os.path.getsize(fn)
+    return OrderedDict([("seconds", seconds), ("records", records),
+                        ("mb_per_s", size / (1024 * 1024) / seconds), ("records_per_s", records / seconds)])
+
+def stage_cache(fn, frames):
+    # column cache of the viewer messages, reading a cached column compared to decoding it again
+    import log_cache, flight_data
+    # a link without csv next to it, so that FlightData reads the cache
+    cache_fn = fn.split('.')[0] + '_cache.bin'
+    os.symlink(fn, cache_fn)
+    flight_data.FlightData.SHARE_BLOCKS = False
+    cache = log_cache.LogCache(cache_fn)
+    t0 = time.time()
+    cache.update(LOG_MSGS, correct_errors=True)
+    build_seconds = time.time() - t0
+    t0 = time.time()
+    cache.read('ATT')
+    read_seconds = time.time() - t0
+    decode_seconds, records = _decode(fn, [("TIME", "*"), ("ATT", "*")])
+    t0 = time.time()
+    data = flight_data.FlightData(cache_fn)
+    data.read_data()
+    read_data_seconds = time.time() - t0
+    raw = cached = 0
+    for msg_name in LOG_MSGS:
+        if cache.header(msg_name) is not None:
+            msg_raw, msg_cached = cache.sizes(msg_name)
+            raw += msg_raw
+            cached += msg_cached
+    return OrderedDict([("build_seconds", build_seconds), ("read_att_seconds", read_seconds),
+                        ("decode_att_seconds", decode_seconds), ("read_data_seconds", read_data_seconds),
+                        ("raw_mb", raw / (1024 * 1024)), ("cached_mb", cached / (1024 * 1024)),
+                        ("ratio", cached / raw if raw else None)])
+
+def stage_read_data(fn, frames):
+    import flight_data
+    flight_data.FlightData.SHARE_BLOCKS = False
+    t0 = time.time()
+    data = flight_data.FlightData(fn)
+    data.read_data()
+    seconds = time.time() - t0
+    samples = len(data.time)
+    return OrderedDict([("seconds", seconds), ("samples", samples), ("samples_per_s", samples / seconds),
+                        ("cache_mb", flight_data.series_cache.size / (1024 * 1024))])
+
+def stage_attitude(fn, frames):
+    # array attitude conversions: samples per second against the scalar versions and round-trip errors
+    import attitude
+    result = attitude.throughput(100000)
+    errors = attitude.check(100000)
+    result["errors"] = errors
+    result["errors_ok"] = not attitude.failed_checks(errors)
+    return result
+
+def _percentiles(values):
+    values = sorted(values)
+    return OrderedDict([("mean_ms", 1000 * sum(values) / len(values)),
+                        ("median_ms", 1000 * values[len(values) // 2]),
+                        ("p95_ms", 1000 * values[int(0.95 * (len(values) - 1))])])
+
+def stage_animate(fn, frames):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import plot_maneuver_quad
+    viewer = plot_maneuver_quad.FlightData(fn)
+    viewer.read_data()
+    fig = plt.figure()
+    viewer.ax = fig.add_subplot(1, 1, 1, projection='3d')
+    frame_times = []
+    draw_times = []
+    for i in range(frames):
+        t0 = time.time()
+        viewer.animate(i)
+        t1 = time.time()
+        fig.canvas.draw()
+        frame_times.append(t1 - t0)
+        draw_times.append(time.time() - t1)
+    result = OrderedDict([("frames", frames)])
+    result["animate"] = _percentiles(frame_times)
+    result["draw"] = _percentiles(draw_times)
+    return result
+
+# measures the import of a command module in a fresh interpreter
+_IMPORT_SCRIPT = """
+import sys, time
+t0 = time.time()
+import %s
+t1 = time.time()
+print('%%f %%i' %% (t1 - t0, 'matplotlib' in sys.modules))
+"""
+
+def _wall_time(args):
+    t0 = time.time()
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(args, stdout=devnull, stderr=devnull, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.time() - t0
+
+def stage_startup(fn, frames):
+    # import time and help startup time of every command
+    import flightanalyzer
+    entry = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flightanalyzer.py")
+    result = OrderedDict([("interpreter_ms", 1000 * _wall_time([sys.executable, "-c", "pass"]))])
+    for command, module, description in flightanalyzer.COMMANDS:
+        out = subprocess.check_output([sys.executable, "-c", _IMPORT_SCRIPT % (module or "flight_data")],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        import_time, plotting = out.decode("utf-8").split()
+        result[command] = OrderedDict([("import_ms", 1000 * float(import_time)),
+                                       ("help_ms", 1000 * _wall_time([sys.executable, entry, command, "-h"])),
+                                       ("loads_matplotlib", plotting == "1")])
+    return result
+
+STAGES = OrderedDict([
+    ("startup", stage_startup),
+    ("decode", stage_decode),
+    ("csv", stage_csv),
+    ("columns", stage_columns),
+    ("cache", stage_cache),
+    ("read_data", stage_read_data),
+    ("attitude", stage_attitude),
+    ("animate", stage_animate),
+])
+
+def run_stage(name, fn, frames):
+    # run one stage in a fresh interpreter and return its results
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--stage", name, fn, str(frames)],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(out.decode("utf-8").strip().splitlines()[-1], object_pairs_hook=OrderedDict)
+
+def git_version():
+    try:
+        out = subprocess.check_output(["git", "describe", "--always", "--dirty"],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.STDOUT)
+        return out.decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    print("\n%-24s %12s %12s %8s" % ("stage", "baseline", "current", "ratio"))
+    for name, stage in results["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if old is None:
+            continue
+        for key, value in stage.items():
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    old_value = old.get(key, {}).get(sub_key)
+                    if old_value and not isinstance(sub_value, bool):
+                        print("%-24s %12.4g %12.4g %8.2f" % ("%s.%s.%s" % (name, key, sub_key), old_value, sub_value, sub_value / old_value))
+            elif key.endswith(("seconds", "_per_s", "_mb")) and old.get(key):
+                print("%-24s %12.4g %12.4g %8.2f" % ("%s.%s" % (name, key), old[key], value, value / old[key]))
+
+def _stage_main():
+    name, fn, frames = sys.argv[2], sys.argv[3], int(sys.argv[4])
+    result = STAGES[name](fn, frames)
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result))
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if len(argv) > 1 and argv[1] == "--stage":
+        _stage_main()
+        return
+    if len(argv) > 1 and argv[1] in ("-h", "--help"):
+        print(__doc__)
+        return
+    log_file = None
+    size = 20.0
+    corruption = 0.0
+    frames = 200
+    out_file = None
+    baseline_file = None
+    opt = None
+    for arg in argv[1:]:
+        if opt != None:
+            if opt == "l":
+                log_file = arg
+            elif opt == "s":
+                size = float(arg)
+            elif opt == "c":
+                corruption = float(arg)
+            elif opt == "f":
+                frames = int(arg)
+            elif opt == "o":
+                out_file = arg
+            elif opt == "b":
+                baseline_file = arg
+            opt = None
+        elif arg in ("-l", "-s", "-c", "-f", "-o", "-b"):
+            opt = arg[1]
+
+    work_dir = tempfile.mkdtemp(prefix="flightanalyzer_bench_")
+    try:
+        fn = os.path.join(work_dir, "bench.bin")
+        if log_file is None:
+            import sdlog2_gen
+            with open(fn, "wb") as f:
+                sdlog2_gen.generate(f, int(size * 1024 * 1024), corruption=corruption)
+        else:
+            # work on a link, the conversion writes next to the log
+            os.symlink(os.path.abspath(log_file), fn)
+        results = OrderedDict()
+        results["version"] = git_version()
+        results["python"] = platform.python_version()
+        results["platform"] = platform.platform()
+        results["date"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        results["log"] = OrderedDict([("file", log_file), ("size_mb", os.path.getsize(fn) / (1024 * 1024)),
+                                      ("corruption", corruption if log_file is None else None)])
+        results["stages"] = OrderedDict()
+        for name in STAGES:
+            print("running %s ..." % name, file=sys.stderr)
+            results["stages"][name] = run_stage(name, fn, frames)
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(json.dumps(results, indent=2))
+    if out_file is not None:
+        with open(out_file, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline_file is not None:
+        with open(baseline_file) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    _main()
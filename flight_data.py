@@ -0,0 +1,458 @@
+# Author: Roman Bapst
+# Description: Lazily loaded flight data of a px4 log, shared by the viewers
+
+from __future__ import division
+import numpy as np
+from collections import OrderedDict
+import json,os.path
+import attitude
+
+__author__ = "Roman Bapst"
+
+class SeriesCache(object):
+    """Decoded series of all open logs, least recently used groups are evicted
+    once the total size exceeds max_bytes. Evicting a group frees it unless it
+    is still referenced elsewhere, an open viewer holds the groups it renders
+    (see FlightData.hold_groups)."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        try:
+            value, size = self.entries.pop(key)
+        except KeyError:
+            return None
+        self.entries[key] = (value, size)
+        return value
+
+    def put(self, key, value, size):
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.size += size
+        # always keep the newest entry, even if it exceeds the budget on its own
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            self.size -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+series_cache = SeriesCache(512 * 1024 * 1024)
+
+# messages converted for FlightData
+LOG_MSGS = ['TIME', 'ATT', 'LPOS', 'ATSP']
+
+def convert_log(file_name):
+    # decode the messages of FlightData into the column cache of the log, unless they are
+    # cached already, returns the cache directory. A csv of an earlier conversion is used instead.
+    csv_file_name = file_name.split('.')[0] + '.csv'
+    if os.path.exists(csv_file_name):
+        return csv_file_name
+    import log_cache
+    cache = log_cache.LogCache(file_name)
+    cache.update(LOG_MSGS)
+    return cache.cache_dir
+
+def convert_log_csv(file_name):
+    # convert the log to csv, only if the csv does not exist yet
+    csv_file_name = file_name.split('.')[0] + '.csv'
+    if not os.path.exists(csv_file_name):
+        import sdlog2_dump
+        parser = sdlog2_dump.SDLog2Parser()
+        parser.setMsgFilter([(msg_name, "*") for msg_name in LOG_MSGS])
+        parser.setTimeMsg('TIME')
+        parser.setFileName(csv_file_name)
+        parser.process(file_name)
+        parser.setFileName(None)
+    return csv_file_name
+
+class _Series(object):
+    # series attribute of FlightData, decoded with its group on first access
+    def __init__(self, group, index=None):
+        self.group = group
+        self.index = index
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        block = obj.get_group(self.group)
+        if self.index is None:
+            return block
+        return block[:, self.index]
+
+class _MsgStream(object):
+    # decoded blocks of one cached message not merged into rows yet, and the
+    # last merged values that are held until the next message
+    def __init__(self, msg_name, labels, blocks):
+        self.msg_name = msg_name
+        self.labels = labels
+        self.blocks = blocks
+        self.done = False
+        self.t = np.zeros(0, dtype=np.int64)
+        self.values = None
+        self.held = dict((label, np.nan) for label in labels)
+        self.seen = False
+
+    def fill(self):
+        # decode the next block while the pending part is empty or ends in the time it starts,
+        # the rows of that time might continue in the next block
+        if self.done or (len(self.t) and self.t[0] != self.t[-1]):
+            return
+        try:
+            block = next(self.blocks)
+        except StopIteration:
+            self.done = True
+            return
+        # stored types, only the rows taken are converted to float64
+        if self.values is None or len(self.t) == 0:
+            self.values = dict((label, block[label]) for label in self.labels)
+        else:
+            self.values = dict((label, np.concatenate([self.values[label], block[label]])) for label in self.labels)
+        self.t = np.concatenate([self.t, block['_t']])
+
+    def take(self, keys, end):
+        # values at the row times keys (last message at or before), consumes the messages before end
+        n = len(self.t) if end is None else int(np.searchsorted(self.t, end, side='left'))
+        index = np.searchsorted(self.t[:n], keys, side='right')
+        values = {}
+        for label in self.labels:
+            # index 0 is the value held from the previous window
+            if n > 0:
+                values[label] = np.where(index > 0, self.values[label][np.maximum(index - 1, 0)], self.held[label])
+            else:
+                values[label] = np.full(len(keys), self.held[label])
+        seen = (index > 0) | self.seen
+        if n > 0:
+            for label in self.labels:
+                self.held[label] = float(self.values[label][n - 1])
+                self.values[label] = self.values[label][n:]
+            self.t = self.t[n:]
+            self.seen = True
+        return values, seen
+
+class FlightData(object):
+    # groups of series decoded together: csv columns and storage type
+    GROUPS = {
+        "time": (["TIME_StartTime"], np.int64),
+        "pos": (["LPOS_X", "LPOS_Y", "LPOS_Z"], np.float32),
+        "q": (["ATT_qw", "ATT_qx", "ATT_qy", "ATT_qz", "ATT_Roll", "ATT_Pitch", "ATT_Yaw"], np.float32),
+        "q_des": (["ATSP_qw", "ATSP_qx", "ATSP_qy", "ATSP_qz"], np.float32),
+        "rpy": (["ATT_Roll", "ATT_Pitch", "ATT_Yaw"], np.float32),
+        "vel": (["LPOS_VX", "LPOS_VY", "LPOS_VZ"], np.float32),
+        "rates": (["ATT_RollRate", "ATT_PitchRate", "ATT_YawRate"], np.float32),
+    }
+    # groups that are NaN if not logged
+    OPTIONAL_GROUPS = ["vel", "rates"]
+    # rows of the log cache before the first of these messages are dropped, they have no position or attitude
+    REQUIRED_MSGS = ["ATT", "LPOS"]
+    # number of csv lines converted at once
+    CHUNK_LINES = 65536
+    # store decoded groups as .npy files next to the csv file, other processes
+    # opening the same log map them instead of decoding and copying
+    SHARE_BLOCKS = True
+
+    # blocks: time (N), pos (N x 3), q and q_des (N x 4, w x y z), rpy (N x 3),
+    # vel (N x 3), rates (N x 3, roll pitch yaw)
+    time = _Series("time")
+    pos = _Series("pos")
+    q = _Series("q")
+    q_des = _Series("q_des")
+    rpy = _Series("rpy")
+    vel = _Series("vel")
+    rates = _Series("rates")
+    # single series as views into the blocks
+    x = _Series("pos", 0)
+    y = _Series("pos", 1)
+    z = _Series("pos", 2)
+    qw = _Series("q", 0)
+    qx = _Series("q", 1)
+    qy = _Series("q", 2)
+    qz = _Series("q", 3)
+    qw_des = _Series("q_des", 0)
+    qx_des = _Series("q_des", 1)
+    qy_des = _Series("q_des", 2)
+    qz_des = _Series("q_des", 3)
+    roll = _Series("rpy", 0)
+    pitch = _Series("rpy", 1)
+    yaw = _Series("rpy", 2)
+    vx = _Series("vel", 0)
+    vy = _Series("vel", 1)
+    vz = _Series("vel", 2)
+    roll_rate = _Series("rates", 0)
+    pitch_rate = _Series("rates", 1)
+    yaw_rate = _Series("rates", 2)
+
+    def __init__(self,file_name):
+        self.log_file_name = file_name
+        self.csv_file_name = file_name.split('.')[0] + ".csv"
+        self.block_dir = file_name.split('.')[0] + ".blocks"
+        self.origin = [0, 0, 0]
+        self.segments = None
+        self.log_cache = None
+        if os.path.exists(self.csv_file_name):
+            self.cache_key = (os.path.abspath(self.csv_file_name), os.path.getmtime(self.csv_file_name))
+            with open(self.csv_file_name,'r') as f:
+                self.header_list = ((f.readline()).rstrip('\n')).split(',')
+        else:
+            # no csv, read the columns of the log cache
+            import log_cache
+            self.log_cache = log_cache.LogCache(file_name)
+            self.log_cache.update(LOG_MSGS)
+            missing = [m for m in self.REQUIRED_MSGS
+                       if self.log_cache.header(m) is None or self.log_cache.header(m)["count"] == 0]
+            if missing:
+                raise ValueError("%s has no %s messages" % (file_name, ", ".join(missing)))
+            msg_names = [m for m in LOG_MSGS if self.log_cache.header(m) is not None]
+            self.cache_key = (os.path.abspath(self.log_cache.cache_dir), self.log_cache.mtime(msg_names))
+            self.header_list = [m + "_" + label for m in msg_names for label in self.log_cache.labels(m)[1:]]
+        self.header_dic = {}
+        for index,item in enumerate(self.header_list):
+            self.header_dic[item] = index
+
+    def get_group(self, group):
+        # a group held by the instance (see hold_groups) is not looked up in the shared cache
+        block = self.__dict__.get(group)
+        if block is not None:
+            return block
+        block = series_cache.get(self.cache_key + (group,))
+        if block is None:
+            block = self.load_block(group)
+            if block is None:
+                block = self.read_data([group])[group]
+            else:
+                series_cache.put(self.cache_key + (group,), block, block.nbytes)
+        return block
+
+    def hold_groups(self, groups):
+        # keep references to the blocks of groups in the instance, the series attributes
+        # then return them without the shared cache. They are not freed by its eviction
+        # while the instance exists, hold only the groups used on every frame.
+        for group in groups:
+            setattr(self, group, self.get_group(group))
+
+    def block_file_name(self, group):
+        return os.path.join(self.block_dir, group + ".npy")
+
+    def load_block(self, group):
+        # map a block stored by another process, if it is newer than the csv file
+        if not self.SHARE_BLOCKS:
+            return None
+        file_name = self.block_file_name(group)
+        try:
+            if os.path.getmtime(file_name) < self.cache_key[1]:
+                return None
+            return np.load(file_name, mmap_mode='r')
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save_file(self, file_name, write):
+        # write(f) to a temporary file in the block directory and rename it to file_name
+        tmp_name = "%s.%i.tmp" % (file_name, os.getpid())
+        try:
+            if not os.path.isdir(self.block_dir):
+                os.makedirs(self.block_dir)
+            with open(tmp_name, 'wb') as f:
+                write(f)
+            os.rename(tmp_name, file_name)
+        except (IOError, OSError):
+            # read-only log directory, keep the data in memory only
+            pass
+
+    def get_segments(self):
+        # flight phase segments [(phase, start, end)], times in seconds since the log start
+        file_name = os.path.join(self.block_dir, "segments.json")
+        if self.segments is None:
+            try:
+                if self.SHARE_BLOCKS and os.path.getmtime(file_name) >= self.cache_key[1]:
+                    with open(file_name, 'r') as f:
+                        self.segments = [tuple(s) for s in json.load(f)]
+            except (IOError, OSError, ValueError):
+                pass
+        if self.segments is None:
+            import flight_phases
+            self.segments = flight_phases.segment(self.time, self.pos, self.vel, self.rates)
+            if self.SHARE_BLOCKS:
+                self.save_file(file_name, lambda f: f.write(json.dumps(self.segments).encode('utf-8')))
+        return self.segments
+
+    def read_data(self, groups=None):
+        # decode the given groups (default: all) in one pass over the csv file or the log cache and cache them
+        if groups is None:
+            groups = list(self.GROUPS)
+        columns = []
+        for group in groups:
+            for label in self.GROUPS[group][0]:
+                if label in self.header_dic and label not in columns:
+                    columns.append(label)
+        chunks = dict((group, []) for group in groups)
+        # shared blocks are written chunk by chunk and mapped, the memory use does not grow with the log
+        appenders = {} if self.SHARE_BLOCKS and self.block_dir_writable() else None
+        if self.log_cache is not None:
+            self.read_cache(groups, columns, chunks, appenders)
+        else:
+            self.read_csv(groups, columns, chunks, appenders)
+        blocks = {}
+        for group in groups:
+            if appenders is not None:
+                appenders[group].close()
+                block = np.load(self.block_file_name(group), mmap_mode='r')
+            else:
+                block = np.concatenate(chunks[group])
+            series_cache.put(self.cache_key + (group,), block, block.nbytes)
+            blocks[group] = block
+        return blocks
+
+    def read_csv(self, groups, columns, chunks, appenders):
+        col_index = [self.header_dic[label] for label in columns]
+        # a column of every required message, the cells are empty before its first message
+        required = []
+        for msg_name in self.REQUIRED_MSGS:
+            labels = [label for label in self.header_list if label.startswith(msg_name + "_")]
+            if labels:
+                required.append(self.header_dic[labels[0]])
+        with open(self.csv_file_name,'r') as f:
+            f.readline()
+            rows = []
+            started = False
+            for line in f:
+                data = line.rstrip('\n').split(',')
+                if not started:
+                    # drop the rows before the first position and attitude, like read_cache
+                    if '' in [data[i] for i in required]:
+                        continue
+                    started = True
+                # fields not logged yet are NaN
+                rows.append([float(data[i] or 'nan') for i in col_index])
+                if len(rows) == self.CHUNK_LINES:
+                    self.convert_chunk(groups, columns, rows, chunks)
+                    self.append_chunks(chunks, appenders)
+                    rows = []
+            self.convert_chunk(groups, columns, rows, chunks)
+            self.append_chunks(chunks, appenders)
+
+    def read_cache(self, groups, columns, chunks, appenders):
+        # the rows of the csv conversion from the cached columns: one row per TIME message
+        # followed by other messages, with the last value of every field up to the next TIME.
+        # The messages are decoded block by block and merged on their time, window by window.
+        cache = self.log_cache
+        streams = []
+        for msg_name in LOG_MSGS:
+            if msg_name != 'TIME' and cache.header(msg_name) is not None:
+                labels = [label[len(msg_name) + 1:] for label in columns if label.startswith(msg_name + "_")]
+                streams.append(_MsgStream(msg_name, labels, cache.blocks(msg_name, ['_t'] + labels)))
+        required = [stream for stream in streams
+                    if stream.msg_name in self.REQUIRED_MSGS and cache.header(stream.msg_name)["count"] > 0]
+        converted = False
+        while True:
+            for stream in streams:
+                stream.fill()
+            pending = [stream for stream in streams if len(stream.t)]
+            if not pending:
+                break
+            # rows before the end of the shortest decoded part are complete for all messages
+            open_ends = [stream.t[-1] for stream in pending if not stream.done]
+            end = min(open_ends) if open_ends else None
+            parts = [stream.t if end is None else stream.t[stream.t < end] for stream in pending]
+            keys = np.unique(np.concatenate(parts))
+            col = {}
+            seen = np.ones(len(keys), dtype=bool)
+            for stream in streams:
+                values, stream_seen = stream.take(keys, end)
+                col.update((stream.msg_name + "_" + label, v) for label, v in values.items())
+                if stream in required:
+                    seen &= stream_seen
+            # drop the rows before the first position and attitude
+            if 'TIME_StartTime' in columns:
+                col['TIME_StartTime'] = keys.astype(np.float64)
+            col = dict((label, v[seen]) for label, v in col.items() if label in columns)
+            if np.any(seen):
+                self.convert_columns(groups, col, int(np.sum(seen)), chunks)
+                self.append_chunks(chunks, appenders)
+                converted = True
+        if not converted:
+            # empty blocks of the right shape
+            self.convert_columns(groups, dict((label, np.zeros(0)) for label in columns), 0, chunks)
+            self.append_chunks(chunks, appenders)
+
+    def block_dir_writable(self):
+        try:
+            if not os.path.isdir(self.block_dir):
+                os.makedirs(self.block_dir)
+        except (IOError, OSError):
+            # read-only log directory, keep the blocks in memory only
+            return False
+        return os.access(self.block_dir, os.W_OK)
+
+    def append_chunks(self, chunks, appenders):
+        # move the converted chunks to the block files
+        if appenders is None:
+            return
+        from sdlog2_columns import NpyAppender
+        for group, group_chunks in chunks.items():
+            for block in group_chunks:
+                if group not in appenders:
+                    appenders[group] = NpyAppender(self.block_file_name(group), block.dtype, block.shape[1:])
+                appenders[group].append(block)
+            del group_chunks[:]
+
+    def convert_chunk(self, groups, columns, rows, chunks):
+        values = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+        col = dict((label, values[:, i]) for i, label in enumerate(columns))
+        self.convert_columns(groups, col, len(rows), chunks)
+
+    def convert_columns(self, groups, col, length, chunks):
+        # col: float64 values of length rows by csv column name
+        for group in groups:
+            labels, dtype = self.GROUPS[group]
+            if group == "time":
+                block = np.rint(col[labels[0]]).astype(dtype)
+            elif group in self.OPTIONAL_GROUPS and not all(label in col for label in labels):
+                block = np.full((length, len(labels)), np.nan, dtype)
+            elif group == "q_des" and labels[0] not in col:
+                #quaternion setpoint not logged yet
+                block = np.zeros((length, 4), dtype)
+            elif group == "q":
+                block = np.column_stack([col[label] for label in labels[:4]])
+                # logs without attitude quaternion, verified correct for RPY values in sdlog2
+                no_quat = np.all(block == 0, axis=1)
+                if np.any(no_quat):
+                    rpy = np.column_stack([col[label][no_quat] for label in labels[4:]])
+                    block[no_quat] = attitude.rpy_to_quat_array(rpy)
+                block = block.astype(dtype)
+            elif group == "q_des":
+                block = np.column_stack([col[label] for label in labels]).astype(dtype)
+                # setpoint not logged yet at the start of the log
+                block[np.isnan(block)] = 0
+            else:
+                block = np.column_stack([col[label] for label in labels]).astype(dtype)
+            chunks[group].append(block)
+
+    def q_at(self, time_us):
+        # attitude quaternions at the given times [us], slerp between the neighbouring samples
+        t = np.asarray(time_us, dtype=np.float64)
+        time = self.time
+        i = np.clip(np.searchsorted(time, t, side='right') - 1, 0, max(len(time) - 2, 0))
+        j = np.minimum(i + 1, len(time) - 1)
+        dt = (time[j] - time[i]).astype(np.float64)
+        fraction = np.clip((t - time[i]) / np.where(dt > 0, dt, 1.0), 0.0, 1.0)
+        return attitude.slerp_array(self.q[i], self.q[j], fraction)
+
+    # conversions, see attitude.py
+
+    def rpy_to_quat_array(self, rpy):
+        return attitude.rpy_to_quat_array(rpy)
+
+    def quat_to_rot(self,q):
+        return attitude.quat_to_rot(q)
+
+    def rot_to_quat(self, R):
+        return attitude.rot_to_quat(R)
+
+    def rpy_to_quat(self,roll,pitch,yaw):
+        return attitude.rpy_to_quat(roll, pitch, yaw)
+
+    def rpy_to_rot(self,roll,pitch,yaw):
+        return attitude.rpy_to_rot(roll, pitch, yaw)
@@ -0,0 +1,107 @@
+# Author: Roman Bapst
+# Description: Segmentation of a flight into phases with vectorized thresholds
+# on the local position velocity, the altitude and the attitude rates.
+
+from __future__ import division
+import numpy as np
+
+__author__ = "Roman Bapst"
+
+PHASES = ['ground', 'takeoff', 'climb', 'hover', 'transition', 'cruise', 'descent', 'landing']
+GROUND, TAKEOFF, CLIMB, HOVER, TRANSITION, CRUISE, DESCENT, LANDING = range(len(PHASES))
+
+GROUND_ALT = 1.0        # [m] above the start altitude, below is on the ground
+CLIMB_RATE = 0.5        # [m/s] vertical speed of climbs and descents
+HOVER_SPEED = 2.0       # [m/s] maximum horizontal speed of hover
+CRUISE_SPEED = 5.0      # [m/s] minimum horizontal speed of cruise
+RATE_MAX = 1.0          # [rad/s] roll or pitch rate above which hover and cruise count as transition
+SMOOTH_TIME = 0.5       # [s] moving average of the signals before thresholding
+MIN_DURATION = 1.0      # [s] shorter segments are merged into the previous one
+
+def _smooth(values, window):
+    # moving average over window samples along the first axis
+    if window <= 1 or len(values) < window:
+        return values
+    c = np.cumsum(np.concatenate([np.zeros((1,) + values.shape[1:]), values]), axis=0)
+    smooth = np.empty_like(values)
+    half = window // 2
+    start = np.clip(np.arange(len(values)) - half, 0, len(values))
+    end = np.clip(np.arange(len(values)) - half + window, 0, len(values))
+    count = (end - start).reshape((-1,) + (1,) * (values.ndim - 1))
+    smooth[:] = (c[end] - c[start]) / count
+    return smooth
+
+def _fill_nan(t, values):
+    # NaN samples of every column interpolated over t, columns without any finite sample are 0
+    values = np.array(values, dtype=np.float64)
+    for i in range(values.shape[1]):
+        finite = np.isfinite(values[:, i])
+        if not np.any(finite):
+            values[:, i] = 0.0
+        elif not np.all(finite):
+            values[~finite, i] = np.interp(t[~finite], t[finite], values[finite, i])
+    return values
+
+def classify(t, pos, vel=None, rates=None):
+    """Phase index of every sample. t [us] (N), pos and vel (N x 3, z down) and
+    rates (N x 3, roll pitch yaw) on the same time base, vel is derived from pos
+    if None or not logged, rates are optional. NaN positions are interpolated."""
+    t = np.asarray(t, dtype=np.float64)
+    # positions not logged (NaN) take the neighbouring valid ones
+    pos = _fill_nan(t, pos)
+    if vel is None or np.all(np.isnan(vel)):
+        vel = np.gradient(pos, t / 1e6, axis=0) if len(t) > 1 else np.zeros_like(pos)
+    vel = np.nan_to_num(np.asarray(vel, dtype=np.float64))
+    dt = np.median(np.diff(t)) / 1e6 if len(t) > 1 else 1.0
+    window = int(SMOOTH_TIME / dt) if dt > 0 else 1
+    vel = _smooth(vel, window)
+    # altitude above the first valid position
+    alt = pos[0, 2] - pos[:, 2]
+    hspeed = np.hypot(vel[:, 0], vel[:, 1])
+
+    phase = np.full(len(t), HOVER, dtype=np.int8)
+    phase[hspeed >= HOVER_SPEED] = TRANSITION
+    phase[hspeed >= CRUISE_SPEED] = CRUISE
+    if rates is not None and not np.all(np.isnan(rates)):
+        rates = _smooth(np.abs(np.nan_to_num(np.asarray(rates, dtype=np.float64))), window)
+        phase[(rates[:, 0] > RATE_MAX) | (rates[:, 1] > RATE_MAX)] = TRANSITION
+    phase[vel[:, 2] < -CLIMB_RATE] = CLIMB
+    phase[vel[:, 2] > CLIMB_RATE] = DESCENT
+    phase[(alt < GROUND_ALT) & (hspeed < HOVER_SPEED) & (np.abs(vel[:, 2]) <= CLIMB_RATE)] = GROUND
+    return phase
+
+def segment(t, pos, vel=None, rates=None, t0=None):
+    """Segment table [(phase, start, end)], times in seconds since t0 [us]
+    (default t[0]). Climbs from the ground are takeoffs, descents to the ground
+    landings."""
+    if len(t) == 0:
+        return []
+    t = np.asarray(t, dtype=np.float64)
+    if t0 is None:
+        t0 = t[0]
+    phase = classify(t, pos, vel, rates)
+    # runs of equal phase
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(phase)) + 1])
+    ends = np.concatenate([starts[1:], [len(t)]])
+    runs = []
+    for p, s, e in zip(phase[starts], starts, ends):
+        if len(runs) and (runs[-1][0] == p or t[e - 1] - t[s] < MIN_DURATION * 1e6):
+            runs[-1][2] = e
+        else:
+            runs.append([p, s, e])
+    segments = []
+    for i, (p, s, e) in enumerate(runs):
+        if p == CLIMB and (i == 0 or runs[i - 1][0] == GROUND):
+            p = TAKEOFF
+        elif p == DESCENT and (i == len(runs) - 1 or runs[i + 1][0] == GROUND):
+            p = LANDING
+        end = t[e] if e < len(t) else t[-1]
+        segments.append((PHASES[p], float(t[s] - t0) / 1e6, float(end - t0) / 1e6))
+    return segments
+
+def durations(segments):
+    # total time per phase [s]
+    result = {}
+    for phase, start, end in segments:
+        result[phase] = result.get(phase, 0.0) + end - start
+    return result
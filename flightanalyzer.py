@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""Command line entry of FlightAnalyzer
+
+Usage: python flightanalyzer.py <command> [arguments]
+
+Every command only imports the modules it needs: converting, indexing and
+cache commands never load the plotting libraries. Run a command without
+arguments or with -h for its usage."""
+
+from __future__ import print_function
+
+import sys
+
+__author__ = "Roman Bapst"
+
+# command, module with _main(argv), description
+COMMANDS = [
+    ("dump", "sdlog2_dump", "Dump a binary log as CSV"),
+    ("convert", None, "Decode logs into the column cache of the viewers, unless done before"),
+    ("columns", "sdlog2_columns", "Decode a log into one file per field, out of core"),
+    ("cache", "log_cache", "Add messages to the compressed column cache of a log"),
+    ("catalog", "sdlog2_catalog", "Index logs into a catalog and query it"),
+    ("view", "plot_maneuver_quad", "3D replay of a multicopter log"),
+    ("view-fw", "plot_flight_maneuver", "3D replay of a fixed-wing / VTOL log"),
+    ("compare", "plot_compare", "Replay several logs side by side"),
+    ("serve", "replay_server", "Serve replays to browsers on this machine"),
+    ("gen", "sdlog2_gen", "Write a synthetic log"),
+    ("bench", "benchmark", "Run the benchmarks"),
+]
+
+def _convert(argv):
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        print("Usage: %s <log.bin> [...]" % argv[0])
+        return
+    import flight_data
+    for file_name in argv[1:]:
+        print(flight_data.convert_log(file_name))
+
+def print_usage():
+    print("Usage: python flightanalyzer.py <command> [arguments]\n")
+    for command, module, description in COMMANDS:
+        print("\t%-10s%s" % (command, description))
+
+def run(command, argv):
+    # argv[0] is the name of the command, returns False for unknown commands
+    for name, module, description in COMMANDS:
+        if name == command:
+            if module is None:
+                _convert(argv)
+            else:
+                __import__(module)._main(argv)
+            return True
+    return False
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        print_usage()
+        return
+    if not run(argv[1], [argv[0] + " " + argv[1]] + argv[2:]):
+        print("Unknown command: %s\n" % argv[1])
+        print_usage()
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,100 @@
+# Author: Roman Bapst
+# Description: Frame time telemetry of the viewers. Stage times of the last
+# frames are kept in a fixed-size buffer, shown in the figure and summarized
+# as histogram at exit.
+
+from __future__ import division, print_function
+import numpy as np
+import json,time
+
+__author__ = "Roman Bapst"
+
+_timer = getattr(time, "perf_counter", time.time)
+
+# frame time histogram bins [ms], 16.7 and 33.3 ms are 60 and 30 fps
+HISTOGRAM_EDGES = [0, 5, 10, 16.7, 25, 33.3, 50, 100, 200, float('inf')]
+
+class FrameTimer(object):
+    """Usage in the render loop: start() at the beginning of the frame, then
+    mark(stage) after every stage. The canvas draw is measured from the end of
+    the frame to the figure's draw_event."""
+    def __init__(self, stages, size=1000, overlay_frames=30):
+        self.stages = list(stages) + ['draw']
+        self.times = np.zeros((size, len(self.stages)))     # [s], ring buffer
+        self.starts = np.zeros(size)                        # frame start times [s]
+        self.count = 0                                      # frames recorded in total
+        self.overlay_frames = overlay_frames
+        self.text = None
+        self.last = None
+        self.frame_end = None
+
+    def attach(self, fig):
+        # show the overlay in fig and measure its canvas draw
+        self.text = fig.text(0.01, 0.01, '', family='monospace', fontsize=8)
+        fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def start(self):
+        i = self.count % len(self.starts)
+        self.times[i] = 0
+        self.last = self.starts[i] = _timer()
+        self.frame_end = None
+
+    def mark(self, stage):
+        now = _timer()
+        self.times[self.count % len(self.starts), self.stages.index(stage)] += now - self.last
+        self.last = now
+
+    def stop(self):
+        self.frame_end = self.last
+        if self.text is None:
+            self.count += 1
+        else:
+            self.update_overlay()
+
+    def on_draw(self, event):
+        if self.frame_end is None:
+            return
+        self.times[self.count % len(self.starts), -1] = _timer() - self.frame_end
+        self.frame_end = None
+        self.count += 1
+
+    def recent(self, frames):
+        # stage times and start times of the last frames, oldest first
+        n = min(frames, self.count, len(self.starts))
+        index = np.arange(self.count - n, self.count) % len(self.starts)
+        return self.times[index], self.starts[index]
+
+    def update_overlay(self):
+        times, starts = self.recent(self.overlay_frames)
+        if len(starts) < 2:
+            return
+        fps = (len(starts) - 1) / (starts[-1] - starts[0])
+        mean = 1000 * times.mean(axis=0)
+        self.text.set_text("%.1f fps  %.1f ms/frame  " % (fps, mean.sum()) +
+                           "  ".join("%s %.1f" % (stage, t) for stage, t in zip(self.stages, mean)))
+
+    def summary(self):
+        times, starts = self.recent(len(self.starts))
+        total = 1000 * times.sum(axis=1)
+        counts = np.histogram(total, bins=HISTOGRAM_EDGES)[0] if len(total) else [0] * (len(HISTOGRAM_EDGES) - 1)
+        result = {"frames": len(total), "histogram_edges_ms": HISTOGRAM_EDGES[:-1], "histogram": [int(c) for c in counts]}
+        for stage, t in zip(self.stages, times.T):
+            if len(t):
+                result[stage + "_ms"] = {"mean": 1000 * t.mean(), "p95": 1000 * np.percentile(t, 95), "max": 1000 * t.max()}
+        return result
+
+    def print_histogram(self):
+        summary = self.summary()
+        counts = summary["histogram"]
+        print("frame times of the last %i frames:" % summary["frames"])
+        scale = 50 / max(max(counts), 1)
+        for low, high, count in zip(HISTOGRAM_EDGES[:-1], HISTOGRAM_EDGES[1:], counts):
+            print("%6.1f - %6.1f ms %6i %s" % (low, high, count, '#' * int(round(count * scale))))
+        for stage in self.stages:
+            t = summary.get(stage + "_ms")
+            if t is not None:
+                print("%-10s mean %6.1f ms  p95 %6.1f ms  max %6.1f ms" % (stage, t["mean"], t["p95"], t["max"]))
+
+    def save(self, file_name):
+        with open(file_name, 'w') as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
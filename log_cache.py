@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+"""Compressed per message column cache of sdlog2 binary logs
+
+Usage: python log_cache.py <log.bin> [-m MSG[,MSG...]] [-l] [-e]
+
+    -m MSG[,MSG...]
+        Only cache these messages. Default is all messages of the log.
+
+    -l  Only list the cached messages, do not decode.
+
+    -e  Recover from errors.
+
+The cache is the directory <log>.cache next to the log with one file per
+message, MSG.col. Messages that are cached already are not decoded again,
+so adding a message decodes and stores only that message. A cache file is
+rebuilt when the log changes (size or modification time).
+
+Every numeric field and the time of the last TIME message (_t) is stored
+in blocks of BLOCK_LEN values, each compressed on its own: integers are delta
+encoded and floats XORed with the previous value, then the bytes are
+shuffled (all first bytes, all second bytes, ...) and compressed with zlib.
+Slowly changing telemetry turns into long runs of equal bytes that way."""
+
+from __future__ import division, print_function
+
+import json, os, shutil, struct, sys, tempfile, zlib
+import numpy as np
+import sdlog2_dump
+from sdlog2_columns import FORMAT_TO_DTYPE, ColumnWriter
+
+__author__ = "Roman Bapst"
+
+CACHE_VERSION = 1
+MAGIC = b"SDLCOL1\n"
+BLOCK_LEN = 65536       # values per compressed block
+LEVEL = 6               # zlib compression level
+
+def _shuffle(values):
+    # bytes of N values as itemsize planes of N bytes
+    b = np.frombuffer(values.tobytes(), dtype=np.uint8).reshape(len(values), values.dtype.itemsize)
+    return b.T.tobytes()
+
+def _unshuffle(data, dtype, length):
+    b = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, length)
+    return np.ascontiguousarray(b.T).view(dtype).reshape(length)
+
+def encode_block(values, encoding):
+    # encoding is 'delta' (integers, wrapping) or 'xor' (bit patterns of floats)
+    values = np.ascontiguousarray(values)
+    if encoding == "xor":
+        values = values.view(np.dtype("u%i" % values.dtype.itemsize))
+    d = values.copy()
+    if encoding == "xor":
+        d[1:] = values[1:] ^ values[:-1]
+    else:
+        d[1:] = values[1:] - values[:-1]
+    return zlib.compress(_shuffle(d), LEVEL)
+
+def decode_block(data, dtype, length, encoding):
+    dtype = np.dtype(dtype)
+    if encoding == "xor":
+        d = _unshuffle(zlib.decompress(data), np.dtype("u%i" % dtype.itemsize), length)
+        return np.bitwise_xor.accumulate(d).view(dtype)
+    d = _unshuffle(zlib.decompress(data), dtype, length)
+    return np.cumsum(d, dtype=dtype)
+
+class LogCache(object):
+    """Column cache of one log, see the module documentation"""
+    def __init__(self, log_file_name, cache_dir=None):
+        self.log_file_name = log_file_name
+        self.cache_dir = cache_dir or log_file_name.split('.')[0] + ".cache"
+        st = os.stat(log_file_name)
+        self.source = [st.st_size, st.st_mtime]
+        self.headers = {}
+
+    def file_name(self, msg_name):
+        return os.path.join(self.cache_dir, msg_name + ".col")
+
+    def header(self, msg_name):
+        # header of a cache file, None if it is missing or out of date
+        if msg_name not in self.headers:
+            header = None
+            try:
+                with open(self.file_name(msg_name), "rb") as f:
+                    f.seek(-8, os.SEEK_END)
+                    length = struct.unpack("<Q", f.read(8))[0]
+                    f.seek(-8 - length, os.SEEK_END)
+                    header = json.loads(f.read(length).decode("utf-8"))
+                if header["version"] != CACHE_VERSION or header["source"] != self.source:
+                    header = None
+            except (IOError, OSError, ValueError, struct.error):
+                pass
+            self.headers[msg_name] = header
+        return self.headers[msg_name]
+
+    def cached_header(self, msg_name):
+        header = self.header(msg_name)
+        if header is None:
+            raise ValueError("%s is not cached for %s" % (msg_name, self.log_file_name))
+        return header
+
+    def index(self):
+        # formats and labels of all messages of the log by name, None before the first update
+        try:
+            with open(os.path.join(self.cache_dir, "index.json"), "r") as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if index.get("version") != CACHE_VERSION or index.get("source") != self.source:
+            return None
+        return index["messages"]
+
+    def messages(self):
+        # names of the cached messages
+        index = self.index()
+        if index is None:
+            return []
+        return sorted(msg_name for msg_name in index if self.header(msg_name) is not None)
+
+    def update(self, msg_names=None, correct_errors=False, budget=16 * 1024 * 1024):
+        """Decode and store the messages msg_names (default: all of the log)
+        that are not cached yet, returns their names"""
+        index = self.index()
+        if msg_names is None:
+            missing = None if index is None else [m for m in sorted(index) if self.header(m) is None]
+        else:
+            # messages not in the log are known after the first update
+            missing = [m for m in msg_names if self.header(m) is None and (index is None or m in index)]
+        if missing == []:
+            return []
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        tmp_dir = tempfile.mkdtemp(prefix="tmp", dir=self.cache_dir)
+        try:
+            parser = sdlog2_dump.SDLog2Parser()
+            if missing is None:
+                parser.setMsgFilter([])
+            else:
+                # the time message is needed for the _t columns
+                parser.setMsgFilter([(m, "*") for m in ["TIME"] + [m for m in missing if m != "TIME"]])
+            parser.setCorrectErrors(correct_errors)
+            writer = ColumnWriter(parser, tmp_dir, budget, max_points=1)
+            parser.setMsgHandler(writer)
+            parser.process(self.log_file_name)
+            stats = writer.close()
+            formats = parser.getMsgFormats()
+            if missing is None:
+                missing = sorted(formats)
+            written = []
+            for msg_name in missing:
+                if msg_name in formats:
+                    msg_format, msg_labels = formats[msg_name]
+                    self.write_msg(msg_name, msg_format, msg_labels, os.path.join(tmp_dir, msg_name), stats.get(msg_name))
+                    written.append(msg_name)
+            index = {"version": CACHE_VERSION, "source": self.source,
+                     "messages": dict((m, list(f)) for m, f in formats.items())}
+            with open(os.path.join(tmp_dir, "index.json"), "w") as f:
+                json.dump(index, f, sort_keys=True)
+            os.rename(os.path.join(tmp_dir, "index.json"), os.path.join(self.cache_dir, "index.json"))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return written
+
+    def write_msg(self, msg_name, msg_format, msg_labels, msg_dir, stats):
+        # encode the .npy columns of msg_dir (missing if no message was logged) into MSG.col
+        columns = [("_t", np.int64)] + [(label, FORMAT_TO_DTYPE[c]) for c, label in zip(msg_format, msg_labels)
+                                        if c in FORMAT_TO_DTYPE]
+        file_name = self.file_name(msg_name)
+        tmp_name = "%s.%i.tmp" % (file_name, os.getpid())
+        header = {"version": CACHE_VERSION, "source": self.source, "name": msg_name, "format": msg_format,
+                  "labels": msg_labels, "count": stats["count"] if stats else 0, "columns": []}
+        with open(tmp_name, "wb") as f:
+            f.write(MAGIC)
+            for label, dtype in columns:
+                npy_file_name = os.path.join(msg_dir, label + ".npy")
+                if os.path.exists(npy_file_name):
+                    values = np.load(npy_file_name, mmap_mode="r")
+                else:
+                    values = np.zeros(0, dtype)
+                encoding = "xor" if np.dtype(dtype).kind == "f" else "delta"
+                blocks = []
+                for i in range(0, len(values), BLOCK_LEN):
+                    block = np.asarray(values[i:i + BLOCK_LEN])
+                    data = encode_block(block, encoding)
+                    blocks.append([f.tell(), len(data), len(block)])
+                    f.write(data)
+                del values
+                field_stats = stats["fields"].get(label) if stats else None
+                header["columns"].append({"label": label, "dtype": np.dtype(dtype).str, "encoding": encoding,
+                                          "blocks": blocks, "stats": field_stats})
+            data = json.dumps(header).encode("utf-8")
+            f.write(data)
+            f.write(struct.pack("<Q", len(data)))
+        os.rename(tmp_name, file_name)
+        self.headers[msg_name] = header
+
+    def labels(self, msg_name):
+        # stored columns of a cached message, _t first
+        return [column["label"] for column in self.header(msg_name)["columns"]]
+
+    def read(self, msg_name, labels=None):
+        """Decoded columns of a cached message by label (default: all), '_t'
+        is the time [us] of the last TIME message"""
+        header = self.cached_header(msg_name)
+        labels = labels or self.labels(msg_name)
+        columns = dict((column["label"], column) for column in header["columns"])
+        result = dict((label, np.empty(header["count"], dtype=np.dtype(columns[label]["dtype"]))) for label in labels)
+        i = 0
+        for block in self.blocks(msg_name, labels):
+            for label in labels:
+                result[label][i:i + len(block[label])] = block[label]
+            i += len(block[labels[0]])
+        return result
+
+    def blocks(self, msg_name, labels=None):
+        """Like read(), one block of up to BLOCK_LEN values of every column at
+        a time, the memory use does not depend on the length of the log"""
+        header = self.cached_header(msg_name)
+        columns = dict((column["label"], column) for column in header["columns"])
+        labels = labels or self.labels(msg_name)
+        with open(self.file_name(msg_name), "rb") as f:
+            # all columns of a message are split at the same rows
+            for k in range(len(columns["_t"]["blocks"])):
+                block = {}
+                for label in labels:
+                    column = columns[label]
+                    offset, nbytes, length = column["blocks"][k]
+                    f.seek(offset)
+                    block[label] = decode_block(f.read(nbytes), column["dtype"], length, column["encoding"])
+                yield block
+
+    def sizes(self, msg_name):
+        # decoded and stored bytes of a cached message
+        header = self.header(msg_name)
+        raw = sum(header["count"] * np.dtype(c["dtype"]).itemsize for c in header["columns"])
+        return raw, sum(b[1] for c in header["columns"] for b in c["blocks"])
+
+    def mtime(self, msg_names):
+        # latest modification time of the cache files of msg_names
+        return max(os.path.getmtime(self.file_name(msg_name)) for msg_name in msg_names)
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        print(__doc__)
+        return
+    fn = argv[1]
+    msg_names = None
+    list_only = False
+    correct_errors = False
+    opt = None
+    for arg in argv[2:]:
+        if opt != None:
+            if opt == "m":
+                msg_names = arg.split(",")
+            opt = None
+        elif arg == "-m":
+            opt = arg[1]
+        elif arg == "-l":
+            list_only = True
+        elif arg == "-e":
+            correct_errors = True
+    cache = LogCache(fn)
+    if not list_only:
+        written = cache.update(msg_names, correct_errors)
+        print("decoded %s" % (", ".join(written) or "nothing"))
+    print("%-16s %10s %12s %12s %7s" % ("message", "count", "raw", "cached", "ratio"))
+    for msg_name in cache.messages():
+        raw, cached = cache.sizes(msg_name)
+        print("%-16s %10i %12i %12i %7.3f" % (msg_name, cache.header(msg_name)["count"], raw, cached,
+                                              cached / raw if raw else 0))
+
+if __name__ == "__main__":
+    _main()
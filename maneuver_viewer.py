@@ -0,0 +1,259 @@
+# Author: Roman Bapst
+# Description: 3D replay of the attitude and relative motion of a vehicle from
+# px4 flight logs. plot_maneuver_quad.py and plot_flight_maneuver.py only set
+# the vehicle model, the decimation and the z sign.
+
+from __future__ import division, print_function
+import numpy as np
+from math import floor
+import atexit,sys
+import flight_data
+import viewer_control
+import frame_timer
+import vehicle_model
+import attitude
+
+__author__ = "Roman Bapst"
+
+class ManeuverViewer(flight_data.FlightData):
+    MODEL = 'quad'          # default vehicle model, see vehicle_model.MODELS
+    STEP = 1                # show every STEP-th sample
+    ZSIGN = 1               # -1 shows the altitude upwards
+    PERCENT_TIME = False    # 'time' and 'set time' in percent of the log instead of seconds
+    DSPAN = 2               # size of the view [m]
+
+    def __init__(self, file_name, model=None):
+        super(ManeuverViewer, self).__init__(file_name)
+        # the series of every frame stay in memory while the viewer is open, the
+        # other groups can be evicted from the shared cache
+        self.hold_groups(['time', 'pos', 'q', 'q_des'])
+        self.model = vehicle_model.get_model(model or self.MODEL)
+        self.ax = None
+        self.animation_state = 'run'
+        self.INDEX = np.arange(0,len(self.time),self.STEP)
+        self.sim_len = len(self.INDEX)
+        self.offset = 0
+        self.ref_i = 0
+        self.frame = 0
+        self.commands = viewer_control.CommandQueue()
+        self.rate = viewer_control.RateMeter()
+        self.frame_timer = None
+
+    def animate(self,i):
+        # commands from the console, control socket and figure are only executed here
+        for command, reply in self.commands.drain():
+            try:
+                answer = self.handle_command(command)
+            except ValueError:
+                answer = "invalid command: %s" % command
+            if answer is not None:
+                reply(answer)
+        timer = self.frame_timer
+        if timer is not None:
+            timer.start()
+        if self.animation_state == 'run':
+            self.frame = self.frame + 1
+        if self.frame >= self.sim_len - 1:
+            self.frame = 0
+            print("looping")
+        ax = self.ax
+        ax.clear()
+        ax.set_xlabel('X')
+        ax.set_ylabel('Y')
+        ax.set_zlabel('Z')
+        sample = self.INDEX[self.frame]
+        position = self.pos[sample] * np.array([1, 1, self.ZSIGN])
+        dspan = self.DSPAN
+        if (dspan > 4):
+            # only move the view when the vehicle leaves it
+            for i, pos in enumerate(position):
+                if (abs(pos - self.origin[i]) > dspan/2):
+                    self.origin[i] = pos
+        else:
+            self.origin[:] = position
+        ax.set_xlim3d([self.origin[0]-dspan/2, self.origin[0]+dspan/2])
+        ax.set_ylim3d([self.origin[1]-dspan/2, self.origin[1]+dspan/2])
+        ax.set_zlim3d([self.origin[2]-dspan/2, self.origin[2]+dspan/2])
+        if self.ZSIGN < 0:
+            ax.invert_zaxis()
+        if timer is not None:
+            timer.mark('clear')
+        line = ax.plot([], [], [])[0]
+        line_des = ax.plot([], [], [])[0]
+        if timer is not None:
+            timer.mark('plot')
+
+        # actual and desired attitude in one batched transform, verified correct for RPY values in sdlog2
+        R = attitude.quat_to_rot_array([self.q[sample], self.q_des[sample]])
+        v, v_des = self.model.transform(R, position)
+        if timer is not None:
+            timer.mark('transform')
+
+        line.set_data(v[:,0], v[:,1])
+        line.set_3d_properties(v[:,2])
+        line_des.set_data(v_des[:,0], v_des[:,1])
+        line_des.set_3d_properties(v_des[:,2])
+        if timer is not None:
+            timer.mark('plot')
+            timer.stop()
+
+        self.rate.update((self.time[sample] - self.time[0])/1e6)
+        return [line, line_des]
+
+    def handle_command(self, user_input):
+        # runs in the render loop, returns the answer to the command (if any)
+        command = user_input.split(' ')
+        if user_input == 'help':
+            return self.help_text()
+        elif user_input == 'time':
+            if self.PERCENT_TIME:
+                return self.frame/self.sim_len*100
+            return (self.time[self.INDEX[self.frame]] - self.time[0])/(1e6)
+        elif user_input == 'sec':
+            return (self.time[self.INDEX[self.frame]] - self.time[0])/(1e6)
+        elif user_input == 'reset':
+            self.frame = 0
+        elif command[0] == 'set' and len(command) > 2:
+            if command[1] == 'time':
+                if self.PERCENT_TIME:
+                    desired_index = floor(float(command[2])/100*self.sim_len)
+                    self.frame = min(int(desired_index), self.sim_len - 1)
+                else:
+                    self.seek(float(command[2]))
+                    return self.time[self.INDEX[self.frame]]
+        elif user_input == 'p':
+            self.animation_state = 'paused'
+        elif user_input == 'r':
+            self.animation_state = 'run'
+        elif user_input == '+' and self.animation_state == 'paused':
+            self.frame = self.frame + 1
+        elif user_input == '-' and self.animation_state == 'paused':
+            self.frame = self.frame - 1
+        elif user_input == 'rtf':
+            return "%.2f (%.1f fps)" % (self.rate.rtf(), self.rate.fps())
+        elif user_input == 'segments':
+            return "\n".join("%3i %-10s %8.1f %8.1f" % ((i,) + s) for i, s in enumerate(self.get_segments()))
+        elif command[0] == 'segment' and len(command) > 1:
+            return self.jump_to_segment(command[1])
+        else:
+            return "unknown input command"
+
+    def seek(self, seconds):
+        # go to the last frame at or before seconds since the log start
+        t = (self.time[self.INDEX] - self.time[0])*1e-6
+        self.frame = min(max(np.searchsorted(t, seconds, side='right') - 1, 0), self.sim_len - 1)
+
+    def jump_to_segment(self, which):
+        # which is a segment number, a phase (next segment of it), 'next' or 'prev'
+        segments = self.get_segments()
+        if not segments:
+            return "no segments"
+        # first frame of every segment, the current segment is the last one started
+        t = (self.time[self.INDEX] - self.time[0])*1e-6
+        starts = np.minimum(np.searchsorted(t, [s[1] - 1e-6 for s in segments]), self.sim_len - 1)
+        current = max(np.searchsorted(starts, self.frame, side='right') - 1, 0)
+        if which == 'next':
+            i = min(current + 1, len(segments) - 1)
+        elif which == 'prev':
+            i = max(current - 1, 0)
+        elif which.isdigit():
+            i = int(which)
+            if i >= len(segments):
+                return "no segment %i" % i
+        else:
+            # next segment of the phase after the current one, wrapping around
+            matches = [j for j, s in enumerate(segments) if s[0] == which]
+            if not matches:
+                return "no %s segment" % which
+            i = min([j for j in matches if j > current] or matches)
+        self.frame = starts[i]
+        return "%i %s %.1f - %.1f s" % ((i,) + tuple(segments[i]))
+
+    def help_text(self):
+        unit = "percent" if self.PERCENT_TIME else "seconds"
+        return """Usage:
+                    time: print momentary time in %s
+                    sec: print momentary time in seconds
+                    reset: reset animation
+                    set time <value>: set the time to <value> [in %s]
+                    p: pause the animation
+                    r: run the animation
+                    + step forward one sample (only in paused mode)
+                    - step backwards one sample (only in paused mode)
+                    rtf: print current real time factor and frame rate
+                    segments: list the flight phase segments [in seconds]
+                    segment <number|phase|next|prev>: go to the start of a segment,
+                        for a phase (e.g. cruise) the next segment of it""" % (unit, unit)
+
+def print_usage(name, viewer_class):
+    print("Usage: %s <log.bin> [-m model] [-c port] [--frame-stats] [--frame-stats-file stats.json]\n" % name)
+    print("\t-m\tVehicle model, one of %s. Default is %s.\n" % (", ".join(sorted(vehicle_model.MODELS)), viewer_class.MODEL))
+    print("\t-c\tAccept commands on this local tcp port as well.\n")
+    print("\t--frame-stats\tShow frame times in the figure and print a histogram at exit.\n")
+    print("\t--frame-stats-file\tLike --frame-stats, and save the histogram as JSON.")
+
+def run(viewer_class, argv):
+    # command line of the viewers, viewer_class is a ManeuverViewer
+    if len(argv) < 2 or argv[1] in ('-h', '--help'):
+        print_usage(argv[0], viewer_class)
+        return
+    file_name = argv[1]
+    model = None
+    control_port = None
+    frame_stats = False
+    frame_stats_file = None
+    opt = None
+    for arg in argv[2:]:
+        if opt != None:
+            if opt == 'm':
+                model = arg
+            elif opt == 'c':
+                control_port = int(arg)
+            elif opt == 'frame-stats-file':
+                frame_stats_file = arg
+            opt = None
+        elif arg in ('-m', '-c'):
+            opt = arg[1]
+        elif arg == '--frame-stats':
+            frame_stats = True
+        elif arg == '--frame-stats-file':
+            frame_stats = True
+            opt = 'frame-stats-file'
+    # check the model before the log is converted
+    try:
+        vehicle_model.get_model(model or viewer_class.MODEL)
+    except ValueError as e:
+        print(e)
+        return
+    #only parse log if the csv does not exist yet
+    flight_data.convert_log(file_name)
+
+    x = viewer_class(file_name, model)
+    print("type 'help' for help")
+    x.commands.read_stdin()
+    if control_port is not None:
+        x.commands.listen(control_port)
+    if frame_stats:
+        # per-frame stage times, shown in the figure and summarized at exit
+        x.frame_timer = frame_timer.FrameTimer(['clear', 'plot', 'transform'])
+        atexit.register(x.frame_timer.print_histogram)
+        if frame_stats_file is not None:
+            atexit.register(x.frame_timer.save, frame_stats_file)
+
+    # Do animation, plotting is only loaded here
+    import matplotlib.pyplot as plt
+    import mpl_toolkits.mplot3d
+    import matplotlib.animation as animation
+    fig = plt.figure()
+    x.ax = fig.add_subplot(1, 1, 1, projection='3d')
+    x.ax.view_init(elev=-170)
+    x.commands.connect_figure(fig)
+    if x.frame_timer is not None:
+        x.frame_timer.attach(fig)
+    line_ani = animation.FuncAnimation(fig, x.animate,interval=10,blit=False)
+    #line_ani.save('movie.mp4',fps=30)
+
+    try:
+        plt.show()
+    except:
+        sys.exit()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+# Author: Roman Bapst
+# Description: This script can be used to compare the attitude and relative
+# motion of several px4 flight logs side by side on one playback clock
+
+from __future__ import division, print_function
+import numpy as np
+from multiprocessing import Pool
+import sys,time,os.path
+import flight_data
+import vehicle_model
+import attitude
+import maneuver_viewer, plot_maneuver_quad, plot_flight_maneuver
+
+__author__ = "Roman Bapst"
+
+# single log viewers, a log is shown with the z sign of the viewer of its vehicle model
+VIEWERS = [plot_maneuver_quad.FlightData, plot_flight_maneuver.FlightData]
+
+def viewer_class(model_name):
+    for viewer in VIEWERS:
+        if viewer.MODEL == model_name:
+            return viewer
+    return maneuver_viewer.ManeuverViewer
+
+def convert_log(file_name):
+    # convert the log if needed and decode all blocks, runs in a worker process
+    flight_data.convert_log(file_name)
+    flight_data.FlightData(file_name).read_data()
+    return file_name
+
+def load_logs(file_names):
+    # decode the logs concurrently, the workers share the decoded blocks through the block files
+    if len(file_names) > 1:
+        pool = Pool(min(len(file_names), 8))
+        try:
+            pool.map(convert_log, file_names)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        convert_log(file_names[0])
+    return [flight_data.FlightData(file_name) for file_name in file_names]
+
+class AlignedLog(object):
+    """One log of the comparison with its time base and precomputed attitudes"""
+    def __init__(self, data, model, event='start', offset=0.0, step=1, zsign=1):
+        self.name = os.path.basename(data.log_file_name)
+        index = np.arange(0, len(data.time), step)
+        time_us = data.time[index]
+        self.pos = np.asarray(data.pos[index], dtype=np.float32)
+        self.align_index = self.find_event(event)
+        # positions as shown by the single log viewer, zsign -1 shows the altitude upwards
+        self.zsign = zsign
+        self.pos = self.pos * np.array([1, 1, zsign], dtype=np.float32)
+        self.t = (time_us - time_us[self.align_index]) / 1e6 + offset
+        self.model = model
+        # rotation matrices of all frames: N x 2 x 3 x 3, actual and desired attitude
+        self.R = np.stack([attitude.quat_to_rot_array(data.q[index]),
+                           attitude.quat_to_rot_array(data.q_des[index])], axis=1).astype(np.float32)
+
+    def find_event(self, event):
+        if event == 'start':
+            return 0
+        elif event == 'takeoff':
+            # first sample 0.5 m above the initial altitude (z down)
+            above = np.nonzero(self.pos[:,2] < self.pos[0,2] - 0.5)[0]
+            return above[0] if len(above) else 0
+        raise ValueError("Unknown event: %s" % event)
+
+    def vertices(self, frame, origin):
+        # path points of the actual and desired attitude relative to origin, one batched transform
+        return self.model.transform(self.R[frame], self.pos[frame] - origin)
+
+    def frame_at(self, t):
+        return min(max(np.searchsorted(self.t, t, side='right') - 1, 0), len(self.t) - 1)
+
+    def time_range(self):
+        return self.t[0], self.t[-1]
+
+class CompareViewer(object):
+    def __init__(self, logs, overlay=False, speed=1.0, dspan=2):
+        self.logs = logs
+        self.overlay = overlay
+        self.speed = speed
+        self.dspan = dspan
+        self.t_start = min(log.time_range()[0] for log in logs)
+        self.t_end = max(log.time_range()[1] for log in logs)
+        self.t = max(self.t_start, 0.0)
+        self.animation_state = 'run'
+        self.last_wall_time = None
+
+        import matplotlib.pyplot as plt
+        import mpl_toolkits.mplot3d.axes3d
+        self.fig = plt.figure()
+        self.axes = []
+        self.lines = []
+        if overlay:
+            ax = self.fig.add_subplot(1, 1, 1, projection='3d')
+            self.axes = [ax] * len(logs)
+        else:
+            cols = int(np.ceil(np.sqrt(len(logs))))
+            rows = int(np.ceil(len(logs) / cols))
+            for i in range(len(logs)):
+                self.axes.append(self.fig.add_subplot(rows, cols, i + 1, projection='3d'))
+        for log, ax in zip(logs, self.axes):
+            ax.view_init(elev=-170)
+            ax.set_xlabel('X')
+            ax.set_ylabel('Y')
+            ax.set_zlabel('Z')
+            if not overlay:
+                ax.set_title(log.name)
+            line = ax.plot([], [], [], label=log.name)[0]
+            line_des = ax.plot([], [], [], linestyle='--', color=line.get_color())[0]
+            self.lines.append((line, line_des))
+        if overlay:
+            self.axes[0].legend()
+        self.time_text = self.fig.text(0.02, 0.02, '')
+        self.fig.canvas.mpl_connect('key_press_event', self.on_key)
+
+    def on_key(self, event):
+        if event.key == ' ':
+            self.animation_state = 'paused' if self.animation_state == 'run' else 'run'
+        elif event.key == 'right':
+            self.t = min(self.t + 1.0, self.t_end)
+        elif event.key == 'left':
+            self.t = max(self.t - 1.0, self.t_start)
+        elif event.key == 'home':
+            self.t = self.t_start
+
+    def advance_clock(self):
+        now = time.time()
+        if self.animation_state == 'run' and self.last_wall_time is not None:
+            self.t += (now - self.last_wall_time) * self.speed
+            if self.t > self.t_end:
+                self.t = self.t_start
+        self.last_wall_time = now
+
+    def animate(self, i):
+        self.advance_clock()
+        artists = []
+        if self.overlay:
+            # all vehicles relative to their own aligned position
+            origins = [log.pos[log.align_index] for log in self.logs]
+        else:
+            origins = [np.zeros(3)] * len(self.logs)
+        for log, ax, (line, line_des), origin in zip(self.logs, self.axes, self.lines, origins):
+            frame = log.frame_at(self.t)
+            v, v_des = log.vertices(frame, origin)
+            line.set_data(v[:,0], v[:,1])
+            line.set_3d_properties(v[:,2])
+            line_des.set_data(v_des[:,0], v_des[:,1])
+            line_des.set_3d_properties(v_des[:,2])
+            artists += [line, line_des]
+            if not self.overlay:
+                self.center(ax, log.pos[frame] - origin, log.zsign)
+        if self.overlay:
+            # the z axis of the overlay follows the first log
+            self.center(self.axes[0], np.mean([log.pos[log.frame_at(self.t)] - o for log, o in zip(self.logs, origins)], axis=0),
+                        self.logs[0].zsign)
+        self.time_text.set_text('t = %.2f s' % self.t)
+        return artists
+
+    def center(self, ax, position, zsign=1):
+        ax.set_xlim3d([position[0]-self.dspan/2, position[0]+self.dspan/2])
+        ax.set_ylim3d([position[1]-self.dspan/2, position[1]+self.dspan/2])
+        zlim = [position[2]-self.dspan/2, position[2]+self.dspan/2]
+        # inverted z axis like the single log viewer for zsign -1
+        ax.set_zlim3d(zlim if zsign > 0 else zlim[::-1])
+
+    def print_help(self):
+        print("""Usage:
+                    space: pause / run the animation
+                    right / left: seek one second forward / backward
+                    home: restart at the earliest aligned time""")
+
+def _print_usage():
+    print("Usage: python plot_compare.py <log1.bin> <log2.bin> [...] [-a start|takeoff] [-o offset1,offset2,...] [-s speed] [-i step] [-m model1,model2,...] [--overlay] [--plane]\n")
+    print("\t-a\tAlign the logs on an event, t = 0 is the start of the log or the takeoff. Default is start.\n")
+    print("\t-o\tAdditional time offset per log in seconds.\n")
+    print("\t-s\tPlayback speed, default is 1 (real time).\n")
+    print("\t-i\tUse every step-th sample only. Default is 1.\n")
+    print("\t--overlay\tDraw all logs in one plot instead of one subplot per log.\n")
+    print("\t-m\tVehicle model per log, one of %s. The last one is used for the remaining logs. Default is quad.\n" % ", ".join(sorted(vehicle_model.MODELS)))
+    print("\t\tA log is shown like in the viewer of its model, fixed-wing logs with the altitude upwards.\n")
+    print("\t--plane\tSame as -m fixedwing.")
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if '-h' in argv[1:] or '--help' in argv[1:]:
+        _print_usage()
+        return
+    file_names = []
+    event = 'start'
+    offsets = []
+    speed = 1.0
+    step = 1
+    overlay = False
+    model = 'quad'
+    opt = None
+    for arg in argv[1:]:
+        if opt != None:
+            if opt == "a":
+                event = arg
+            elif opt == "o":
+                offsets = [float(o) for o in arg.split(",")]
+            elif opt == "s":
+                speed = float(arg)
+            elif opt == "i":
+                step = int(arg)
+            elif opt == "m":
+                model = arg
+            opt = None
+        elif arg in ("-a", "-o", "-s", "-i", "-m"):
+            opt = arg[1]
+        elif arg == "--overlay":
+            overlay = True
+        elif arg == "--plane":
+            model = 'fixedwing'
+        else:
+            file_names.append(arg)
+    if len(file_names) == 0:
+        _print_usage()
+        return
+    offsets += [0.0] * (len(file_names) - len(offsets))
+    model_names = model.split(",")
+    model_names += model_names[-1:] * (len(file_names) - len(model_names))
+    try:
+        models = [vehicle_model.get_model(name) for name in model_names]
+    except ValueError as e:
+        print(e)
+        return
+
+    logs = [AlignedLog(data, model, event, offset, step, viewer_class(model.name).ZSIGN)
+            for data, model, offset in zip(load_logs(file_names), models, offsets)]
+    viewer = CompareViewer(logs, overlay, speed)
+    viewer.print_help()
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    line_ani = animation.FuncAnimation(viewer.fig, viewer.animate, interval=20, blit=False)
+    try:
+        plt.show()
+    except:
+        sys.exit()
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+
+"""Serve 3D replays of px4 logs to browsers on the local machine
+
+Usage: python replay_server.py <log.bin> [...] [-p port] [-m model] [-i step] [-w window] [-v]
+
+    -p  Port of the server on 127.0.0.1. Default is 8000.
+
+    -m  Vehicle model, see vehicle_model.py. Default is quad.
+
+    -i  Use every step-th sample only. Default is 1.
+
+    -w  Frames per window, the unit in which frames are sent. Default is 500.
+
+    -v  Log every request.
+
+Open http://localhost:8000/ to watch. The logs are decoded once. The vehicle
+vertices of a window of frames are computed in one batched transform, sent
+as little-endian float32 records and kept in a cache shared by all viewers.
+Seeking only fetches the window of the new time.
+
+    GET /logs                   JSON list of the logs
+    GET /info?log=i             JSON: frames, window size, points per frame, window start times, segments
+    GET /window?log=i&k=n       binary: frames n*window... as records of
+                                [t, x, y, z, 2 x points x (x, y, z)], actual and desired attitude"""
+
+from __future__ import division, print_function
+
+import json, os.path, sys, threading
+import numpy as np
+import flight_data
+import vehicle_model
+import attitude
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+__author__ = "Roman Bapst"
+
+# encoded windows of all logs, shared by all viewers
+window_cache = flight_data.SeriesCache(128 * 1024 * 1024)
+# events of the windows being encoded, set when they are done
+encoding = {}
+cache_lock = threading.Lock()
+
+class ReplayLog(object):
+    """Decoded log and its windows of transformed vehicle vertices"""
+    def __init__(self, file_name, model, step=1, window=500):
+        flight_data.convert_log(file_name)
+        self.data = flight_data.FlightData(file_name)
+        self.data.read_data(["time", "pos", "q", "q_des", "vel", "rates"])
+        # the requests only use these groups and the segments, not the shared series cache
+        self.data.hold_groups(["time", "pos", "q", "q_des"])
+        self.segments = self.data.get_segments()
+        self.name = os.path.basename(file_name)
+        self.model = model
+        self.window = window
+        self.index = np.arange(0, len(self.data.time), step)
+        self.t = (self.data.time[self.index] - self.data.time[0]) / 1e6
+        self.key = (self.data.cache_key, model.name, step, window)
+
+    def windows(self):
+        return (len(self.index) + self.window - 1) // self.window
+
+    def info(self):
+        return {
+            "name": self.name,
+            "model": self.model.name,
+            "frames": len(self.index),
+            "window": self.window,
+            "points": len(self.model.points),
+            "duration": float(self.t[-1]) if len(self.t) else 0.0,
+            "window_times": [float(t) for t in self.t[::self.window]],
+            "segments": self.segments,
+        }
+
+    def encode_window(self, k):
+        # records of all frames in window k, one batched transform for the actual and desired attitude
+        index = self.index[k * self.window:(k + 1) * self.window]
+        pos = np.asarray(self.data.pos[index], dtype=np.float64)
+        R = np.stack([attitude.quat_to_rot_array(self.data.q[index]),
+                      attitude.quat_to_rot_array(self.data.q_des[index])], axis=1)
+        vertices = self.model.transform(R, pos[:, np.newaxis, :])
+        records = np.column_stack([self.t[k * self.window:(k + 1) * self.window], pos, vertices.reshape(len(index), -1)])
+        return records.astype('<f4').tobytes()
+
+    def get_window(self, k):
+        # windows are encoded outside the lock, a window requested while it is
+        # being encoded is waited for instead of encoded again
+        key = self.key + (k,)
+        while True:
+            with cache_lock:
+                data = window_cache.get(key)
+                if data is not None:
+                    return data
+                event = encoding.get(key)
+                if event is None:
+                    event = encoding[key] = threading.Event()
+                    break
+            event.wait()
+        try:
+            data = self.encode_window(k)
+            with cache_lock:
+                window_cache.put(key, data, len(data))
+        finally:
+            with cache_lock:
+                del encoding[key]
+            event.set()
+        return data
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # the server has the attribute logs, a list of ReplayLog
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            if url.path == "/":
+                self.send(CLIENT_HTML.encode("utf-8"), "text/html; charset=utf-8")
+            elif url.path == "/logs":
+                self.send_json([log.name for log in self.server.logs])
+            elif url.path == "/info":
+                self.send_json(self.get_log(query).info())
+            elif url.path == "/window":
+                log = self.get_log(query)
+                k = int(query["k"][0])
+                if not 0 <= k < log.windows():
+                    raise ValueError("no window %i" % k)
+                # windows never change while the server runs
+                self.send(log.get_window(k), "application/octet-stream", "max-age=3600")
+            else:
+                self.send_error(404)
+        except (KeyError, IndexError, ValueError) as e:
+            self.send_error(400, str(e))
+
+    def get_log(self, query):
+        return self.server.logs[int(query.get("log", ["0"])[0])]
+
+    def send_json(self, value):
+        self.send(json.dumps(value).encode("utf-8"), "application/json")
+
+    def send(self, body, content_type, cache_control="no-cache"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+def make_server(logs, port=8000, verbose=False):
+    server = ThreadingHTTPServer(("127.0.0.1", port), ReplayHandler)
+    server.logs = logs
+    server.verbose = verbose
+    return server
+
+CLIENT_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>FlightAnalyzer replay</title>
+<style>
+body { margin: 0; font-family: sans-serif; font-size: 13px; }
+#bar { padding: 6px; background: #eee; }
+#bar * { vertical-align: middle; }
+#seek { width: 40%; }
+canvas { display: block; }
+</style></head><body>
+<div id="bar">
+<select id="log"></select>
+<button id="play">pause</button>
+<input id="seek" type="range" min="0" max="1000" value="0">
+<span id="time"></span>
+speed <select id="speed"><option>0.25</option><option>0.5</option><option selected>1</option><option>2</option><option>4</option></select>
+<span id="segments"></span>
+</div>
+<canvas id="view"></canvas>
+<script>
+var info = null, log = 0, windows = {}, t = 0, playing = true, last = null;
+var az = 0.6, el = 0.5, span = 2, drag = null;
+var canvas = document.getElementById('view'), ctx = canvas.getContext('2d');
+
+function $(id) { return document.getElementById(id); }
+function get(url, type, done) {
+    var r = new XMLHttpRequest();
+    r.open('GET', url);
+    r.responseType = type;
+    r.onload = function () { if (r.status == 200) done(r.response); };
+    r.send();
+}
+function windowAt(time) {
+    // last window starting at or before time
+    var lo = 0, hi = info.window_times.length - 1;
+    while (lo < hi) {
+        var mid = (lo + hi + 1) >> 1;
+        if (info.window_times[mid] <= time) lo = mid; else hi = mid - 1;
+    }
+    return lo;
+}
+function fetchWindow(k) {
+    if (k < 0 || k >= info.window_times.length || windows[k] !== undefined) return;
+    windows[k] = null;
+    var l = log;
+    get('/window?log=' + log + '&k=' + k, 'arraybuffer', function (buf) {
+        if (l == log) windows[k] = new Float32Array(buf);
+    });
+}
+function load(l) {
+    log = l; windows = {}; t = 0;
+    get('/info?log=' + l, 'json', function (i) {
+        info = i;
+        var s = $('segments');
+        s.innerHTML = '';
+        info.segments.forEach(function (seg) {
+            var b = document.createElement('button');
+            b.textContent = seg[0];
+            b.title = seg[1].toFixed(1) + ' - ' + seg[2].toFixed(1) + ' s';
+            b.onclick = function () { t = seg[1]; };
+            s.appendChild(b);
+        });
+    });
+}
+function project(x, y, z) {
+    // NED to screen, turned by az around the vertical and tilted by el
+    var ca = Math.cos(az), sa = Math.sin(az);
+    var xr = ca * x + sa * y, yr = -sa * x + ca * y;
+    var scale = Math.min(canvas.width, canvas.height) / span;
+    return [canvas.width / 2 + scale * yr, canvas.height / 2 - scale * (xr * Math.sin(el) - z * Math.cos(el))];
+}
+function draw(rec, o) {
+    var points = info.points;
+    ['#1f77b4', '#ff7f0e'].forEach(function (color, line) {
+        ctx.strokeStyle = color;
+        ctx.beginPath();
+        var gap = true;
+        for (var p = 0; p < points; p++) {
+            var i = o + 4 + 3 * (line * points + p);
+            if (isNaN(rec[i])) { gap = true; continue; }
+            var s = project(rec[i] - rec[o + 1], rec[i + 1] - rec[o + 2], rec[i + 2] - rec[o + 3]);
+            if (gap) ctx.moveTo(s[0], s[1]); else ctx.lineTo(s[0], s[1]);
+            gap = false;
+        }
+        ctx.stroke();
+    });
+}
+function tick(now) {
+    requestAnimationFrame(tick);
+    if (last !== null && playing && info) {
+        t += (now - last) / 1000 * parseFloat($('speed').value);
+        if (t > info.duration) t = 0;
+    }
+    last = now;
+    canvas.width = window.innerWidth;
+    canvas.height = window.innerHeight - $('bar').offsetHeight;
+    if (!info) return;
+    var k = windowAt(t);
+    fetchWindow(k);
+    fetchWindow(k + 1);
+    // only keep the windows around the current one
+    for (var key in windows) if (key < k - 1 || key > k + 1) delete windows[key];
+    $('time').textContent = t.toFixed(2) + ' / ' + info.duration.toFixed(1) + ' s';
+    if (document.activeElement != $('seek')) $('seek').value = 1000 * t / Math.max(info.duration, 1e-6);
+    var rec = windows[k];
+    if (!rec) return;
+    var size = 4 + 6 * info.points, frames = rec.length / size, f = 0;
+    while (f + 1 < frames && rec[(f + 1) * size] <= t) f++;
+    draw(rec, f * size);
+}
+get('/logs', 'json', function (names) {
+    names.forEach(function (name, i) {
+        var o = document.createElement('option');
+        o.value = i; o.textContent = name;
+        $('log').appendChild(o);
+    });
+    load(0);
+});
+$('log').onchange = function () { load(parseInt(this.value)); };
+$('play').onclick = function () { playing = !playing; this.textContent = playing ? 'pause' : 'play'; };
+$('seek').oninput = function () { if (info) t = this.value / 1000 * info.duration; };
+canvas.onmousedown = function (e) { drag = [e.clientX, e.clientY]; };
+window.onmouseup = function () { drag = null; };
+window.onmousemove = function (e) {
+    if (!drag) return;
+    az += (e.clientX - drag[0]) / 200;
+    el = Math.max(-1.5, Math.min(1.5, el + (e.clientY - drag[1]) / 200));
+    drag = [e.clientX, e.clientY];
+};
+canvas.onwheel = function (e) { span *= e.deltaY > 0 ? 1.1 : 1 / 1.1; e.preventDefault(); };
+requestAnimationFrame(tick);
+</script></body></html>
+"""
+
+def _print_usage():
+    print("Usage: python replay_server.py <log.bin> [...] [-p port] [-m model] [-i step] [-w window] [-v]\n")
+    print("\t-p\tPort of the server on 127.0.0.1. Default is 8000.\n")
+    print("\t-m\tVehicle model, one of %s. Default is quad.\n" % ", ".join(sorted(vehicle_model.MODELS)))
+    print("\t-i\tUse every step-th sample only. Default is 1.\n")
+    print("\t-w\tFrames per window, the unit in which frames are sent. Default is 500.\n")
+    print("\t-v\tLog every request.")
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        _print_usage()
+        return
+    file_names = []
+    port = 8000
+    model = "quad"
+    step = 1
+    window = 500
+    verbose = False
+    opt = None
+    for arg in argv[1:]:
+        if opt != None:
+            if opt == "p":
+                port = int(arg)
+            elif opt == "m":
+                model = arg
+            elif opt == "i":
+                step = int(arg)
+            elif opt == "w":
+                window = int(arg)
+            opt = None
+        elif arg in ("-p", "-m", "-i", "-w"):
+            opt = arg[1]
+        elif arg == "-v":
+            verbose = True
+        else:
+            file_names.append(arg)
+    try:
+        model = vehicle_model.get_model(model)
+    except ValueError as e:
+        print(e)
+        return
+    logs = [ReplayLog(file_name, model, step, window) for file_name in file_names]
+    server = make_server(logs, port, verbose)
+    print("serving %i logs on http://localhost:%i/" % (len(logs), port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+
+"""Index sdlog2 binary logs into a local SQLite catalog and query it
+
+Usage: python sdlog2_catalog.py index <catalog.db> <log.bin|dir> [...] [-e]
+       python sdlog2_catalog.py query <catalog.db> [-m MSG[_field1,field2,...]] [-w STAT<op>VALUE] [-p PHASE] [-v]
+       python sdlog2_catalog.py segments <catalog.db> [-m ...] [-w ...] [-p PHASE]
+
+    index   Scan logs (directories recursively) and store message types, record
+            counts, duration, summary statistics and flight phase segments.
+            Unchanged files are skipped, logs that no longer exist are removed.
+
+    -e      Recover from errors while scanning.
+
+    query   Print the logs matching all given conditions.
+
+    -m MSG[_field1,field2,...]
+            Only logs containing records of MSG (and the given fields).
+            Multiple -m options allowed.
+
+    -w STAT<op>VALUE
+            Only logs whose statistic STAT compares to VALUE, op is one of
+            < <= > >= = !=. STAT is "duration" [s], "records", MSG_field_min,
+            MSG_field_max, roll_err_max, pitch_err_max, yaw_err_max [deg] or
+            PHASE_duration [s], the total time spent in a flight phase.
+            Multiple -w options allowed.
+
+    -p PHASE
+            Only logs with a segment of PHASE, one of ground, takeoff, climb,
+            hover, transition, cruise, descent, landing. Multiple -p options allowed.
+
+    -v      Also print duration and record count.
+
+    segments
+            Print the segments (phase, start and end in seconds since the log
+            start) of the matching logs, only those of PHASE if -p is given."""
+
+from __future__ import print_function
+
+import array, math, os, re, sqlite3, sys, time
+import sdlog2_dump
+
+__author__ = "Roman Bapst"
+
+LOG_EXTENSIONS = (".bin", ".px4log")
+
+# messages decoded for summary statistics, all others are only counted
+STAT_MSGS = ["TIME", "ATT", "ATSP", "LPOS"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    size INTEGER,
+    mtime REAL,
+    duration REAL,
+    records INTEGER,
+    indexed REAL);
+CREATE TABLE IF NOT EXISTS messages (log_id INTEGER, name TEXT, format TEXT, count INTEGER);
+CREATE TABLE IF NOT EXISTS fields (log_id INTEGER, name TEXT);
+CREATE TABLE IF NOT EXISTS stats (log_id INTEGER, name TEXT, value REAL);
+CREATE TABLE IF NOT EXISTS segments (log_id INTEGER, phase TEXT, start_time REAL, end_time REAL);
+CREATE INDEX IF NOT EXISTS messages_name ON messages (name, log_id);
+CREATE INDEX IF NOT EXISTS fields_name ON fields (name, log_id);
+CREATE INDEX IF NOT EXISTS stats_name_log ON stats (name, log_id, value);
+CREATE INDEX IF NOT EXISTS segments_phase ON segments (phase, log_id);
+"""
+
+# version 1 added the segments, catalogs older than it are indexed again.
+# Version 2 indexes the stats by log, for the per log conditions of where().
+SCHEMA_VERSION = 2
+
+# fields collected for the flight phase segmentation
+SEGMENT_FIELDS = {
+    "LPOS": ["X", "Y", "Z", "VX", "VY", "VZ"],
+    "ATT": ["RollRate", "PitchRate", "YawRate"],
+}
+
+CONDITION_RE = re.compile(r"^\s*(\w+)\s*(<=|>=|!=|<|>|=)\s*(\S+)\s*$")
+
+def _wrap_pi(angle):
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+class LogSummary(object):
+    """Message handler for SDLog2Parser collecting cheap per-log statistics"""
+    def __init__(self):
+        self.start_time = None
+        self.end_time = None
+        self.minmax = {}        # [min, max] by "MSG_label"
+        self.setpoint = None    # latest ATSP data
+        self.err_max = {}       # maximum attitude error by axis name [rad]
+        self.samples = {}       # [time, SEGMENT_FIELDS...] values by message name
+        self.field_index = {}
+
+    def __call__(self, msg_name, msg_labels, data):
+        if msg_name == "TIME":
+            if self.start_time == None:
+                self.start_time = data[0]
+            self.end_time = data[0]
+            return
+        if msg_name in SEGMENT_FIELDS and self.end_time != None:
+            self.add_sample(msg_name, msg_labels, data)
+        for label, value in zip(msg_labels, data):
+            if not isinstance(value, (int, float)) or value != value:
+                continue
+            key = msg_name + "_" + label
+            mm = self.minmax.get(key)
+            if mm == None:
+                self.minmax[key] = [value, value]
+            elif value < mm[0]:
+                mm[0] = value
+            elif value > mm[1]:
+                mm[1] = value
+        if msg_name == "ATSP":
+            self.setpoint = dict(zip(msg_labels, data))
+        elif msg_name == "ATT" and self.setpoint != None:
+            att = dict(zip(msg_labels, data))
+            for axis in ("Roll", "Pitch", "Yaw"):
+                try:
+                    err = abs(_wrap_pi(att[axis] - self.setpoint[axis + "SP"]))
+                except KeyError:
+                    continue
+                if err > self.err_max.get(axis, 0.0):
+                    self.err_max[axis] = err
+
+    def add_sample(self, msg_name, msg_labels, data):
+        index = self.field_index.get(msg_name)
+        if index == None:
+            try:
+                index = [msg_labels.index(label) for label in SEGMENT_FIELDS[msg_name]]
+            except ValueError:
+                index = []
+            self.field_index[msg_name] = index
+            self.samples[msg_name] = array.array("d")
+        if index:
+            samples = self.samples[msg_name]
+            samples.append(self.end_time)
+            samples.extend(data[i] for i in index)
+
+    def segments(self):
+        # flight phase segments from the collected LPOS (and ATT) samples
+        import numpy as np
+        import flight_phases
+        if len(self.samples.get("LPOS", [])) == 0:
+            return []
+        lpos = np.frombuffer(self.samples["LPOS"], dtype=np.float64).reshape(-1, 7)
+        rates = None
+        if len(self.samples.get("ATT", [])):
+            att = np.frombuffer(self.samples["ATT"], dtype=np.float64).reshape(-1, 4)
+            rates = np.column_stack([np.interp(lpos[:, 0], att[:, 0], att[:, i]) for i in range(1, 4)])
+        return flight_phases.segment(lpos[:, 0], lpos[:, 1:4], lpos[:, 4:7], rates, t0=self.start_time)
+
+    def duration(self):
+        if self.start_time == None:
+            return None
+        return (self.end_time - self.start_time) / 1e6
+
+    def stats(self):
+        result = []
+        for key, (vmin, vmax) in self.minmax.items():
+            result.append((key + "_min", vmin))
+            result.append((key + "_max", vmax))
+        for axis, err in self.err_max.items():
+            result.append((axis.lower() + "_err_max", math.degrees(err)))
+        return result
+
+class LogCatalog(object):
+    def __init__(self, db_name):
+        self.db = sqlite3.connect(db_name)
+        self.db.executescript(SCHEMA)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with self.db:
+                if version < 1:
+                    self.db.execute("UPDATE logs SET mtime = -1")
+                self.db.execute("DROP INDEX IF EXISTS stats_name")
+                self.db.execute("PRAGMA user_version = %i" % SCHEMA_VERSION)
+
+    def close(self):
+        self.db.close()
+
+    def find_logs(self, paths):
+        for path in paths:
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        if name.lower().endswith(LOG_EXTENSIONS):
+                            yield os.path.join(root, name)
+            else:
+                yield path
+
+    def is_current(self, path, st):
+        row = self.db.execute("SELECT size, mtime FROM logs WHERE path = ?", (path,)).fetchone()
+        return row != None and row[0] == st.st_size and row[1] == st.st_mtime
+
+    def index(self, paths, correct_errors=False):
+        # returns the number of (indexed, unchanged, failed, removed) logs
+        indexed = unchanged = failed = 0
+        for path in self.find_logs(paths):
+            path = os.path.abspath(path)
+            try:
+                # the file may be gone or unreadable since the directory was scanned
+                st = os.stat(path)
+                if self.is_current(path, st):
+                    unchanged += 1
+                    continue
+                self.index_log(path, st, correct_errors)
+                indexed += 1
+            except Exception as e:
+                print("skipping %s: %s" % (path, e), file=sys.stderr)
+                failed += 1
+        return indexed, unchanged, failed, self.remove_missing()
+
+    def remove_missing(self):
+        # delete the logs whose files no longer exist, returns their number
+        rows = [row for row in self.db.execute("SELECT id, path FROM logs").fetchall() if not os.path.exists(row[1])]
+        if rows:
+            with self.db:
+                self.db.executemany("DELETE FROM logs WHERE id = ?", [(row[0],) for row in rows])
+                # one pass over every table, the indexes do not start with log_id
+                for table in ("messages", "fields", "stats", "segments"):
+                    self.db.execute("DELETE FROM %s WHERE log_id NOT IN (SELECT id FROM logs)" % table)
+        return len(rows)
+
+    def index_log(self, path, st, correct_errors=False):
+        import flight_phases
+        summary = LogSummary()
+        parser = sdlog2_dump.SDLog2Parser()
+        parser.setMsgFilter([(msg_name, "*") for msg_name in STAT_MSGS])
+        parser.setCorrectErrors(correct_errors)
+        parser.setMsgHandler(summary)
+        parser.process(path)
+        counts = parser.getMsgCounts()
+        formats = parser.getMsgFormats()
+        segments = summary.segments()
+
+        with self.db:
+            row = self.db.execute("SELECT id FROM logs WHERE path = ?", (path,)).fetchone()
+            if row != None:
+                for table in ("messages", "fields", "stats", "segments"):
+                    self.db.execute("DELETE FROM %s WHERE log_id = ?" % table, row)
+                self.db.execute("DELETE FROM logs WHERE id = ?", row)
+            log_id = self.db.execute("INSERT INTO logs (path, size, mtime, duration, records, indexed) VALUES (?, ?, ?, ?, ?, ?)",
+                                     (path, st.st_size, st.st_mtime, summary.duration(), sum(counts.values()), time.time())).lastrowid
+            for msg_name, (msg_format, msg_labels) in formats.items():
+                self.db.execute("INSERT INTO messages VALUES (?, ?, ?, ?)", (log_id, msg_name, msg_format, counts.get(msg_name, 0)))
+                self.db.executemany("INSERT INTO fields VALUES (?, ?)", [(log_id, msg_name + "_" + label) for label in msg_labels])
+            self.db.executemany("INSERT INTO stats VALUES (?, ?, ?)", [(log_id, name, value) for name, value in summary.stats()])
+            self.db.executemany("INSERT INTO segments VALUES (?, ?, ?, ?)", [(log_id,) + s for s in segments])
+            self.db.executemany("INSERT INTO stats VALUES (?, ?, ?)", [(log_id, phase + "_duration", value)
+                                                                        for phase, value in flight_phases.durations(segments).items()])
+
+    def query(self, msg_filter=[], conditions=[], phases=[]):
+        # msg_filter as in SDLog2Parser.setMsgFilter, conditions as list of "STAT<op>VALUE" strings,
+        # phases as list of flight phases the logs must have a segment of
+        sql, args = self.where(msg_filter, conditions, phases)
+        return self.db.execute("SELECT path, duration, records FROM logs WHERE " + sql + " ORDER BY path", args).fetchall()
+
+    def segments(self, msg_filter=[], conditions=[], phases=[]):
+        # segments (path, phase, start, end) of the logs matching the query, only of the given phases if any
+        sql, args = self.where(msg_filter, conditions, phases)
+        if phases:
+            sql += " AND segments.phase IN (%s)" % ", ".join("?" * len(phases))
+            args += phases
+        return self.db.execute("SELECT path, phase, start_time, end_time FROM segments JOIN logs ON logs.id = segments.log_id WHERE " +
+                               sql + " ORDER BY path, start_time", args).fetchall()
+
+    def where(self, msg_filter, conditions, phases):
+        # condition on the logs table and its arguments
+        sql = "1"
+        args = []
+        for msg_name, show_fields in msg_filter:
+            sql += " AND EXISTS (SELECT 1 FROM messages WHERE log_id = logs.id AND name = ? AND count > 0)"
+            args.append(msg_name)
+            if show_fields != "*":
+                for field in show_fields:
+                    sql += " AND EXISTS (SELECT 1 FROM fields WHERE log_id = logs.id AND name = ?)"
+                    args.append(msg_name + "_" + field)
+        for condition in conditions:
+            m = CONDITION_RE.match(condition)
+            if m == None:
+                raise ValueError("Invalid condition: %s" % condition)
+            name, op, value = m.groups()
+            if name in ("duration", "records"):
+                sql += " AND %s %s ?" % (name, op)
+                args.append(float(value))
+            else:
+                sql += " AND EXISTS (SELECT 1 FROM stats WHERE log_id = logs.id AND name = ? AND value %s ?)" % op
+                args += [name, float(value)]
+        for phase in phases:
+            sql += " AND EXISTS (SELECT 1 FROM segments WHERE log_id = logs.id AND phase = ?)"
+            args.append(phase)
+        return sql, list(args)
+
+def _print_usage():
+    print("Usage: python sdlog2_catalog.py index <catalog.db> <log.bin|dir> [...] [-e]")
+    print("       python sdlog2_catalog.py query <catalog.db> [-m MSG[_field1,field2,...]] [-w STAT<op>VALUE] [-p PHASE] [-v]")
+    print("       python sdlog2_catalog.py segments <catalog.db> [-m ...] [-w ...] [-p PHASE]\n")
+    print("\tindex\tScan logs (directories recursively), unchanged files are skipped.\n")
+    print("\t-e\tRecover from errors.\n")
+    print("\tquery\tPrint the logs matching all given conditions.\n")
+    print("\t-m MSG[_field1,field2,...]\n\t\tOnly logs containing records of MSG (and the given fields).\n\t\tMultiple -m options allowed.\n")
+    print("\t-w STAT<op>VALUE\n\t\tOnly logs whose statistic compares to VALUE, e.g. pitch_err_max>20, duration>=60\n\t\tor cruise_duration>30. Multiple -w options allowed.\n")
+    print("\t-p PHASE\n\t\tOnly logs with a segment of PHASE (ground, takeoff, climb, hover, transition, cruise,\n\t\tdescent, landing). Multiple -p options allowed.\n")
+    print("\t-v\tAlso print duration and record count.\n")
+    print("\tsegments\tPrint the segments of the matching logs (only of PHASE if -p is given).")
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if len(argv) < 3 or argv[1] not in ("index", "query", "segments"):
+        _print_usage()
+        return
+    command = argv[1]
+    catalog = LogCatalog(argv[2])
+    paths = []
+    msg_filter = []
+    conditions = []
+    phases = []
+    correct_errors = False
+    verbose = False
+    opt = None
+    for arg in argv[3:]:
+        if opt != None:
+            if opt == "m":
+                show_fields = "*"
+                a = arg.split("_")
+                if len(a) > 1:
+                    show_fields = a[1].split(",")
+                msg_filter.append((a[0], show_fields))
+            elif opt == "w":
+                conditions.append(arg)
+            elif opt == "p":
+                phases.append(arg)
+            opt = None
+        else:
+            if arg == "-e":
+                correct_errors = True
+            elif arg == "-v":
+                verbose = True
+            elif arg == "-m":
+                opt = "m"
+            elif arg == "-w":
+                opt = "w"
+            elif arg == "-p":
+                opt = "p"
+            else:
+                paths.append(arg)
+
+    if command == "index":
+        t0 = time.time()
+        indexed, unchanged, failed, removed = catalog.index(paths, correct_errors)
+        print("indexed %i, unchanged %i, failed %i, removed %i logs in %.1f s" % (indexed, unchanged, failed, removed,
+                                                                                  time.time() - t0))
+    elif command == "segments":
+        for path, phase, start, end in catalog.segments(msg_filter, conditions, phases):
+            print("%s\t%s\t%.1f\t%.1f" % (path, phase, start, end))
+    else:
+        for path, duration, records in catalog.query(msg_filter, conditions, phases):
+            if verbose:
+                print("%s\t%s\t%s" % (path, "" if duration == None else "%.1f" % duration, records))
+            else:
+                print(path)
+    catalog.close()
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+"""Decode an sdlog2 binary log into one .npy file per message field, out of core
+
+Usage: python sdlog2_columns.py <log.bin> <out_dir> [-m MSG[,MSG...]] [-b budget] [-d points] [-e]
+
+    -m MSG[,MSG...]
+        Only decode these messages. Default is all.
+
+    -b  Memory budget of the decoded values buffered before they are written,
+        in MB. Default is 16.
+
+    -d  Maximum number of points of the decimated views. Default is 1000.
+
+    -e  Recover from errors.
+
+Every message MSG gets a directory out_dir/MSG with one file per numeric field
+and _t.npy, the time [us] of the last TIME message. String fields are not
+written. The memory use does not depend on the length of the log: decoded
+values are appended to the files block by block, and the statistics
+(stats.json) and the min / max / mean views (decimated.npz) are computed on the
+way."""
+
+from __future__ import division, print_function
+
+import array, json, os, struct, sys
+import numpy as np
+import sdlog2_dump
+
+__author__ = "Roman Bapst"
+
+# storage type of the format chars, string fields (n, N, Z) are not stored
+FORMAT_TO_DTYPE = {
+    "b": np.int8, "B": np.uint8, "M": np.uint8,
+    "h": np.int16, "H": np.uint16,
+    "i": np.int32, "I": np.uint32,
+    "q": np.int64, "Q": np.uint64,
+    "f": np.float32,
+    # scaled by the multiplier of SDLog2Parser.FORMAT_TO_STRUCT
+    "c": np.float64, "C": np.float64, "e": np.float64, "E": np.float64, "L": np.float64,
+}
+
+class NpyAppender(object):
+    """.npy file growing by append(block) along the first axis. The header is
+    written with room for any length and completed by close(). The file is only
+    open while a block is written, logs with many fields would run out of file
+    descriptors otherwise."""
+    HEADER_LEN = 128
+
+    def __init__(self, file_name, dtype, shape_tail=()):
+        self.file_name = file_name
+        self.dtype = np.dtype(dtype)
+        self.shape_tail = tuple(shape_tail)
+        self.length = 0
+        self.tmp_name = "%s.%i.tmp" % (file_name, os.getpid())
+        with open(self.tmp_name, "wb") as f:
+            f.write(self.header())
+
+    def header(self):
+        d = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            str(np.lib.format.dtype_to_descr(self.dtype)), (self.length,) + self.shape_tail)
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", self.HEADER_LEN - 10) + d.ljust(self.HEADER_LEN - 11).encode("ascii") + b"\n"
+
+    def append(self, block):
+        block = np.ascontiguousarray(block, dtype=self.dtype)
+        if len(block) == 0:
+            return
+        with open(self.tmp_name, "ab") as f:
+            f.write(block.tobytes())
+        self.length += len(block)
+
+    def close(self):
+        with open(self.tmp_name, "r+b") as f:
+            f.write(self.header())
+        os.rename(self.tmp_name, self.file_name)
+
+class RunningStats(object):
+    """Count, mean, standard deviation, min and max of a series updated block
+    by block (Welford / Chan et al.), NaN values are ignored"""
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        n_b = len(values)
+        mean_b = values.mean()
+        m2_b = ((values - mean_b) ** 2).sum()
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+        vmin, vmax = values.min(), values.max()
+        self.min = vmin if self.min is None else min(self.min, vmin)
+        self.max = vmax if self.max is None else max(self.max, vmax)
+
+    def std(self):
+        return (self.m2 / self.n) ** 0.5 if self.n > 0 else None
+
+    def to_dict(self):
+        return {"n": self.n, "mean": float(self.mean) if self.n else None, "std": self.std() and float(self.std()),
+                "min": None if self.min is None else float(self.min),
+                "max": None if self.max is None else float(self.max)}
+
+class Decimator(object):
+    """min / max / mean view of a series in at most max_points buckets of equal
+    sample count. When the buckets are full, pairs of them are merged and the
+    bucket size doubles, so the view always covers the whole series."""
+    def __init__(self, max_points=1000):
+        self.max_points = max_points
+        self.size = 1                               # samples per bucket
+        self.buckets = np.zeros((0, 5))             # t, min, max, sum, count
+        self.pending = None                         # partly filled last bucket
+
+    def update(self, t, values):
+        t = np.asarray(t, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        i = 0
+        if self.pending is not None:
+            i = int(min(self.size - self.pending[4], len(values)))
+            self.pending = self.merge(self.pending, self.aggregate(t[:i], values[:i]))
+            if self.pending[4] == self.size:
+                self.buckets = np.vstack([self.buckets, self.pending])
+                self.pending = None
+        full = (len(values) - i) // self.size * self.size
+        if full:
+            v = values[i:i + full].reshape(-1, self.size)
+            self.buckets = np.vstack([self.buckets, np.column_stack([
+                t[i:i + full:self.size], v.min(axis=1), v.max(axis=1), v.sum(axis=1), np.full(len(v), self.size)])])
+        if i + full < len(values):
+            self.pending = self.merge(self.pending, self.aggregate(t[i + full:], values[i + full:]))
+        while len(self.buckets) > self.max_points:
+            self.halve()
+
+    def halve(self):
+        # merge pairs of buckets, an odd last bucket joins the pending one
+        pairs = len(self.buckets) // 2
+        a, b = self.buckets[0:2 * pairs:2], self.buckets[1:2 * pairs:2]
+        if len(self.buckets) % 2:
+            self.pending = self.merge(self.buckets[-1], self.pending)
+        self.buckets = np.column_stack([a[:, 0], np.minimum(a[:, 1], b[:, 1]), np.maximum(a[:, 2], b[:, 2]),
+                                        a[:, 3] + b[:, 3], a[:, 4] + b[:, 4]])
+        self.size *= 2
+
+    @staticmethod
+    def aggregate(t, values):
+        if len(values) == 0:
+            return None
+        return np.array([t[0], values.min(), values.max(), values.sum(), len(values)])
+
+    @staticmethod
+    def merge(a, b):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return np.array([a[0], min(a[1], b[1]), max(a[2], b[2]), a[3] + b[3], a[4] + b[4]])
+
+    def view(self):
+        # P x 4 array of bucket start time, min, max, mean
+        buckets = self.buckets if self.pending is None else np.vstack([self.buckets, self.pending])
+        return np.column_stack([buckets[:, 0], buckets[:, 1], buckets[:, 2], buckets[:, 3] / np.maximum(buckets[:, 4], 1)])
+
+class _MsgBuffer(object):
+    # buffered values of one message and its output columns. Times and 64 bit
+    # integer fields are buffered as integers, float64 is not exact above 2^53,
+    # the other numeric fields as float64 rows.
+    def __init__(self, msg_format, columns):
+        self.fields = [i for i, c in enumerate(msg_format) if c in FORMAT_TO_DTYPE]
+        self.wide = [i for i in self.fields if msg_format[i] in "qQ"]
+        narrow = [i for i in self.fields if i not in self.wide]
+        self.narrow = None if len(narrow) == len(msg_format) else narrow
+        self.row_len = len(narrow)
+        self.columns = columns
+        self.clear()
+
+    def clear(self):
+        self.times = []
+        self.rows = array.array("d")
+        self.wide_values = [[] for i in self.wide]
+
+    def values(self):
+        # buffered values of every column in the order of columns
+        t = np.array(self.times, dtype=np.int64)
+        rows = np.frombuffer(self.rows, dtype=np.float64).reshape(len(t), self.row_len)
+        values = [t]
+        n = 0
+        for i, column in zip(self.fields, self.columns[1:]):
+            if i in self.wide:
+                values.append(np.array(self.wide_values[self.wide.index(i)], dtype=column[1].dtype))
+            else:
+                values.append(rows[:, n])
+                n += 1
+        return values
+
+class ColumnWriter(object):
+    """Message handler of SDLog2Parser writing the numeric fields of every
+    message to out_dir/MSG/<field>.npy. Decoded rows are buffered until
+    budget bytes are reached and then appended to the files."""
+    def __init__(self, parser, out_dir, budget=16 * 1024 * 1024, max_points=1000, time_msg="TIME"):
+        self.parser = parser
+        self.out_dir = out_dir
+        self.budget_values = budget // 8
+        self.max_points = max_points
+        self.time_msg = time_msg
+        self.time = 0
+        self.buffered = 0
+        self.msgs = {}      # _MsgBuffer by message name
+
+    def __call__(self, msg_name, msg_labels, data):
+        msg = self.msgs.get(msg_name)
+        if msg == None:
+            msg = self.add_msg(msg_name, msg_labels)
+        if msg_name == self.time_msg:
+            self.time = data[0]
+        msg.times.append(self.time)
+        if msg.narrow == None:
+            msg.rows.extend(data)
+        else:
+            msg.rows.extend(data[i] for i in msg.narrow)
+        for buf, i in zip(msg.wide_values, msg.wide):
+            buf.append(data[i])
+        self.buffered += len(msg.columns)
+        if self.buffered >= self.budget_values:
+            self.flush()
+
+    def add_msg(self, msg_name, msg_labels):
+        msg_format = self.parser.getMsgFormats()[msg_name][0]
+        msg_dir = os.path.join(self.out_dir, msg_name)
+        if not os.path.isdir(msg_dir):
+            os.makedirs(msg_dir)
+        # name, file, statistics, decimated view of every column
+        columns = [("_t", NpyAppender(os.path.join(msg_dir, "_t.npy"), np.int64), None, None)]
+        for i, c in enumerate(msg_format):
+            if c in FORMAT_TO_DTYPE:
+                label = msg_labels[i]
+                columns.append((label, NpyAppender(os.path.join(msg_dir, label + ".npy"), FORMAT_TO_DTYPE[c]),
+                                RunningStats(), Decimator(self.max_points)))
+        msg = _MsgBuffer(msg_format, columns)
+        self.msgs[msg_name] = msg
+        return msg
+
+    def flush(self):
+        # append the buffered rows of all messages to their files
+        for msg_name, msg in self.msgs.items():
+            if len(msg.times) == 0:
+                continue
+            values = msg.values()
+            t = values[0]
+            for (label, appender, stats, decimator), v in zip(msg.columns, values):
+                appender.append(v)
+                if stats is not None:
+                    stats.update(v)
+                    decimator.update(t, v)
+            del values, t
+            msg.clear()
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        stats = {}
+        views = {}
+        for msg_name, msg in self.msgs.items():
+            fields = {}
+            for label, appender, field_stats, decimator in msg.columns:
+                appender.close()
+                if field_stats is not None:
+                    fields[label] = field_stats.to_dict()
+                    views[msg_name + "_" + label] = decimator.view()
+            stats[msg_name] = {"count": msg.columns[0][1].length, "fields": fields}
+        with open(os.path.join(self.out_dir, "stats.json"), "w") as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+        np.savez(os.path.join(self.out_dir, "decimated.npz"), **views)
+        return stats
+
+def write_columns(fn, out_dir, msg_names=None, budget=16 * 1024 * 1024, max_points=1000, correct_errors=False):
+    """Decode the log fn into out_dir, returns the statistics by message name"""
+    parser = sdlog2_dump.SDLog2Parser()
+    if msg_names:
+        # the time message is needed for the _t columns
+        parser.setMsgFilter([(msg_name, "*") for msg_name in ["TIME"] + [m for m in msg_names if m != "TIME"]])
+    else:
+        parser.setMsgFilter([])
+    parser.setCorrectErrors(correct_errors)
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    writer = ColumnWriter(parser, out_dir, budget, max_points)
+    parser.setMsgHandler(writer)
+    parser.process(fn)
+    return writer.close()
+
+def load_column(out_dir, msg_name, label, mmap_mode="r"):
+    return np.load(os.path.join(out_dir, msg_name, label + ".npy"), mmap_mode=mmap_mode)
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if len(argv) < 3 or argv[1] in ("-h", "--help"):
+        print(__doc__)
+        return
+    fn, out_dir = argv[1], argv[2]
+    msg_names = None
+    budget = 16.0
+    max_points = 1000
+    correct_errors = False
+    opt = None
+    for arg in argv[3:]:
+        if opt != None:
+            if opt == "m":
+                msg_names = arg.split(",")
+            elif opt == "b":
+                budget = float(arg)
+            elif opt == "d":
+                max_points = int(arg)
+            opt = None
+        elif arg in ("-m", "-b", "-d"):
+            opt = arg[1]
+        elif arg == "-e":
+            correct_errors = True
+    stats = write_columns(fn, out_dir, msg_names, int(budget * 1024 * 1024), max_points, correct_errors)
+    for msg_name in sorted(stats):
+        print("%-16s %10i" % (msg_name, stats[msg_name]["count"]))
+
+if __name__ == "__main__":
+    _main()
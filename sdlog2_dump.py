@@ -16,12 +16,18 @@ Usage: python sdlog2_dump.py <log.bin> [-v] [-e] [-d delimiter] [-n null] [-m MS
     
     -m MSG[.field1,field2,...]
         Dump only messages of specified type, and only specified fields.
-        Multiple -m options allowed."""
+        Multiple -m options allowed.
+
+    --stats
+        Print per message type record counts, bytes and decode and output times to stderr.
+
+    --stats-file <stats.json>
+        Like --stats, but save the numbers as JSON."""
 
 __author__  = "Anton Babushkin"
 __version__ = "1.2"
 
-import struct, sys
+import json, struct, sys, time
 
 if sys.hexversion >= 0x030000F0:
     runningPython3 = True
@@ -32,6 +38,53 @@ else:
     def _parseCString(cstr):
         return str(cstr).split('\0')[0]
 
+_timer = getattr(time, "perf_counter", time.time)
+
+class SDLog2Stats:
+    """Counts and times collected by SDLog2Parser.process, times in seconds"""
+    def __init__(self):
+        self.total_time = 0.0
+        self.format_time = 0.0      # FORMAT messages
+        self.filter_time = 0.0      # message filter lookups
+        self.row_time = 0.0         # formatting and writing of CSV rows
+        self.rows = 0
+        self.skipped_bytes = 0      # bytes skipped while searching a valid header
+        self.msgs = {}              # [count, bytes, unpack time, convert time, output time] by message name
+
+    def addMsg(self, msg_name, msg_length):
+        s = self.msgs.get(msg_name)
+        if s == None:
+            s = self.msgs[msg_name] = [0, 0, 0.0, 0.0, 0.0]
+        s[0] += 1
+        s[1] += msg_length
+        return s
+
+    def toDict(self):
+        msgs = {}
+        for msg_name, s in self.msgs.items():
+            msgs[msg_name] = {"count": s[0], "bytes": s[1], "unpack_time": s[2], "convert_time": s[3], "output_time": s[4]}
+        return {"total_time": self.total_time, "format_time": self.format_time, "filter_time": self.filter_time,
+                "row_time": self.row_time, "rows": self.rows, "skipped_bytes": self.skipped_bytes,
+                "other_time": self.otherTime(), "msgs": msgs}
+
+    def otherTime(self):
+        # header scanning, buffer handling and everything else not measured separately
+        measured = self.format_time + self.filter_time + self.row_time
+        for s in self.msgs.values():
+            measured += s[2] + s[3] + s[4]
+        return self.total_time - measured
+
+    def printReport(self, out=sys.stderr):
+        print("%-6s %10s %12s %12s %12s %12s %10s" % ("MSG", "count", "bytes", "unpack [ms]", "convert [ms]", "output [ms]", "us/msg"), file=out)
+        for msg_name in sorted(self.msgs, key=lambda n: -sum(self.msgs[n][2:])):
+            count, nbytes, t_unpack, t_convert, t_output = self.msgs[msg_name]
+            print("%-6s %10i %12i %12.1f %12.1f %12.1f %10.2f" % (msg_name, count, nbytes, t_unpack * 1e3, t_convert * 1e3, t_output * 1e3,
+                                                             (t_unpack + t_convert + t_output) * 1e6 / count), file=out)
+        print("FORMAT messages: %.1f ms, filter lookup: %.1f ms, CSV rows: %i in %.1f ms" % (
+              self.format_time * 1e3, self.filter_time * 1e3, self.rows, self.row_time * 1e3), file=out)
+        print("header scan and other: %.1f ms, skipped bytes: %i, total: %.1f ms" % (
+              self.otherTime() * 1e3, self.skipped_bytes, self.total_time * 1e3), file=out)
+
 class SDLog2Parser:
     BLOCK_SIZE = 8192
     MSG_HEADER_LEN = 3
@@ -68,6 +121,8 @@ class SDLog2Parser:
     __correct_errors = False
     __file_name = None
     __file = None
+    __msg_handler = None
+    __stats = None
     
     def __init__(self):
         return
@@ -82,6 +137,7 @@ class SDLog2Parser:
         self.__csv_data = {}        # current values for all columns
         self.__csv_updated = False
         self.__msg_filter_map = {}  # filter in form of map, with '*" expanded to full list of fields
+        self.__msg_counts = {}      # number of data messages by message name map
     
     def setCSVDelimiter(self, csv_delim):
         self.__csv_delim = csv_delim
@@ -108,6 +164,28 @@ class SDLog2Parser:
     	else:
     		self.__file = None
 
+    def setStats(self, stats):
+        # SDLog2Stats instance to collect statistics in, None disables it
+        self.__stats = stats
+
+    def getStats(self):
+        return self.__stats
+
+    def setMsgHandler(self, msg_handler):
+        # msg_handler(msg_name, msg_labels, data) is called for every decoded message instead of CSV output
+        self.__msg_handler = msg_handler
+
+    def getMsgCounts(self):
+        # number of data messages by message name, only counted with a message handler or statistics
+        if self.__stats != None:
+            return dict((msg_name, s[0]) for msg_name, s in self.__stats.msgs.items())
+        return self.__msg_counts
+
+    def getMsgFormats(self):
+        formats = {}
+        for msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults in self.__msg_descrs.values():
+            formats[msg_name] = (msg_format, msg_labels)
+        return formats
     
     def process(self, fn):
         self.reset()
@@ -116,6 +194,9 @@ class SDLog2Parser:
             for msg_name, show_fields in self.__msg_filter:
                 self.__msg_filter_map[msg_name] = show_fields
         first_data_msg = True
+        stats = self.__stats
+        if stats != None:
+            t_start = _timer()
         f = open(fn, "rb")
         bytes_read = 0
         while True:
@@ -130,6 +211,8 @@ class SDLog2Parser:
                 if (head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2):
                     if self.__correct_errors:
                         self.__ptr += 1
+                        if stats != None:
+                            stats.skipped_bytes += 1
                         continue
                     else:
                         raise Exception("Invalid header at %i (0x%X): %02X %02X, must be %02X %02X" % (bytes_read + self.__ptr, bytes_read + self.__ptr, head1, head2, self.MSG_HEAD1, self.MSG_HEAD2))
@@ -138,7 +221,11 @@ class SDLog2Parser:
                     # parse FORMAT message
                     if self.__bytesLeft() < self.MSG_FORMAT_PACKET_LEN:
                         break
+                    if stats != None:
+                        t0 = _timer()
                     self.__parseMsgDescr()
+                    if stats != None:
+                        stats.format_time += _timer() - t0
                 else:
                     # parse data message
                     msg_descr = self.__msg_descrs[msg_type]
@@ -156,6 +243,8 @@ class SDLog2Parser:
         if not self.__debug_out and self.__time_msg != None and self.__csv_updated:
             self.__printCSVRow()
         f.close()
+        if stats != None:
+            stats.total_time += _timer() - t_start
     
     def __bytesLeft(self):
         return len(self.__buffer) - self.__ptr
@@ -178,6 +267,8 @@ class SDLog2Parser:
                 full_label = msg_name + "_" + field
                 self.__csv_columns.append(full_label)
                 self.__csv_data[full_label] = None
+        if self.__msg_handler != None:
+            return
         if self.__file != None:
             print(self.__csv_delim.join(self.__csv_columns), file=self.__file)
         else:
@@ -231,22 +322,43 @@ class SDLog2Parser:
     
     def __parseMsg(self, msg_descr):
         msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults = msg_descr
+        stats = self.__stats
         if not self.__debug_out and self.__time_msg != None and msg_name == self.__time_msg and self.__csv_updated:
+            if stats != None:
+                t0 = _timer()
             self.__printCSVRow()
             self.__csv_updated = False
+            if stats != None:
+                stats.row_time += _timer() - t0
+                stats.rows += 1
+        if stats != None:
+            msg_stats = stats.addMsg(msg_name, msg_length)
+            t0 = _timer()
+        elif self.__msg_handler != None:
+            # the CSV output does not count, see getMsgCounts
+            self.__msg_counts[msg_name] = self.__msg_counts.get(msg_name, 0) + 1
         show_fields = self.__filterMsg(msg_name)
+        if stats != None:
+            t1 = _timer()
+            stats.filter_time += t1 - t0
         if (show_fields != None):
             if runningPython3:
                 data = list(struct.unpack(msg_struct, self.__buffer[self.__ptr+self.MSG_HEADER_LEN:self.__ptr+msg_length]))
             else:
                 data = list(struct.unpack(msg_struct, str(self.__buffer[self.__ptr+self.MSG_HEADER_LEN:self.__ptr+msg_length])))
+            if stats != None:
+                t2 = _timer()
             for i in range(len(data)):
-                if type(data[i]) is str:
+                if type(data[i]) is bytes:
                     data[i] = _parseCString(data[i])
                 m = msg_mults[i]
                 if m != None:
                     data[i] = data[i] * m
-            if self.__debug_out:
+            if stats != None:
+                t3 = _timer()
+            if self.__msg_handler != None:
+                self.__msg_handler(msg_name, msg_labels, data)
+            elif self.__debug_out:
                 s = []
                 for i in range(len(data)):
                     label = msg_labels[i]
@@ -263,10 +375,16 @@ class SDLog2Parser:
                             self.__csv_updated = True
                 if self.__time_msg == None:
                     self.__printCSVRow()
+            if stats != None:
+                msg_stats[2] += t2 - t1
+                msg_stats[3] += t3 - t2
+                msg_stats[4] += _timer() - t3
         self.__ptr += msg_length
 
-def _main():
-    if len(sys.argv) < 2:
+def _main(argv=None):
+    if argv == None:
+        argv = sys.argv
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
         print("Usage: python sdlog2_dump.py <log.bin> [-v] [-e] [-d delimiter] [-n null] [-m MSG[.field1,field2,...]] [-t TIME_MSG_NAME]\n")
         print("\t-v\tUse plain debug output instead of CSV.\n")
         print("\t-e\tRecover from errors.\n")
@@ -275,8 +393,10 @@ def _main():
         print("\t-m MSG[.field1,field2,...]\n\t\tDump only messages of specified type, and only specified fields.\n\t\tMultiple -m options allowed.")
         print("\t-t\tSpecify TIME message name to group data messages by time and significantly reduce duplicate output.\n")
         print("\t-fPrint to file instead of stdout")
+        print("\t--stats\tPrint per message type counts, bytes and decode and output times to stderr.\n")
+        print("\t--stats-file\tSave these statistics as JSON to the given file.")
         return
-    fn = sys.argv[1]
+    fn = argv[1]
     debug_out = False
     correct_errors = False
     msg_filter = []
@@ -284,8 +404,10 @@ def _main():
     csv_delim = ","
     time_msg = "TIME"
     file_name = None
+    stats = None
+    stats_file = None
     opt = None
-    for arg in sys.argv[2:]:
+    for arg in argv[2:]:
         if opt != None:
             if opt == "d":
                 csv_delim = arg
@@ -295,6 +417,8 @@ def _main():
                 time_msg = arg
             elif opt == "f":
             	file_name = arg
+            elif opt == "stats-file":
+                stats_file = arg
             elif opt == "m":
                 show_fields = "*"
                 a = arg.split("_")
@@ -317,6 +441,11 @@ def _main():
                 opt = "t"
             elif arg == "-f":
                 opt = "f"
+            elif arg == "--stats":
+                stats = SDLog2Stats()
+            elif arg == "--stats-file":
+                stats = SDLog2Stats()
+                opt = "stats-file"
 
     if csv_delim == "\\t":
         csv_delim = "\t"
@@ -328,7 +457,13 @@ def _main():
     parser.setFileName(file_name)
     parser.setDebugOut(debug_out)
     parser.setCorrectErrors(correct_errors)
+    parser.setStats(stats)
     parser.process(fn)
+    if stats_file != None:
+        with open(stats_file, "w") as f:
+            json.dump(stats.toDict(), f, indent=2, sort_keys=True)
+    elif stats != None:
+        stats.printReport()
 
 if __name__ == "__main__":
     _main()
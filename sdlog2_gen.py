@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""Write synthetic sdlog2 binary logs for benchmarks
+
+Usage: python sdlog2_gen.py <log.bin> [-s size] [-m MSG=rate[,MSG=rate...]] [-c corruption] [-r seed]
+
+    -s  Approximate size of the log in MB. Default is 10.
+
+    -m MSG=rate[,MSG=rate...]
+        Probability of logging MSG per TIME message, 0 disables it. Messages are
+        ATT, LPOS, ATSP and the string messages VER (N, Z fields) and TEXT (Z).
+        Default is ATT=1,LPOS=1,ATSP=1,VER=0.01,TEXT=0.05.
+
+    -c  Fraction of messages followed by a block of garbage bytes, the log
+        can then only be read with sdlog2_dump.py -e. Default is 0.
+
+    -r  Seed of the random generator. Default is 0."""
+
+from __future__ import division, print_function
+
+import math, random, struct, sys
+from sdlog2_dump import SDLog2Parser
+from attitude import rpy_to_quat
+
+__author__ = "Roman Bapst"
+
+# name, format, labels as logged by sdlog2
+MESSAGES = [
+    ("TIME", "Q", "StartTime"),
+    ("ATT", "fffffffffffff", "qw,qx,qy,qz,Roll,Pitch,Yaw,RollRate,PitchRate,YawRate,GX,GY,GZ"),
+    ("LPOS", "ffffffffLLfBBBff", "X,Y,Z,Dist,DistR,VX,VY,VZ,RLat,RLon,RAlt,PFlg,LFlg,GFlg,EPH,EPV"),
+    ("ATSP", "ffffffff", "RollSP,PitchSP,YawSP,ThrustSP,qw,qx,qy,qz"),
+    ("VER", "NZ", "Arch,FwGit"),
+    ("TEXT", "Z", "Text"),
+]
+
+DEFAULT_RATES = {"ATT": 1.0, "LPOS": 1.0, "ATSP": 1.0, "VER": 0.01, "TEXT": 0.05}
+
+# time between two TIME messages [us]
+TIME_STEP = 4000
+
+class FlightProfile(object):
+    """Takeoff, hover, cruise, hover and landing spread over the log duration [s]"""
+    # phase name, fraction of the duration
+    PHASES = [("ground", 0.05), ("climb", 0.1), ("hover", 0.15), ("cruise", 0.4),
+              ("hover", 0.15), ("descent", 0.1), ("ground", 0.05)]
+    ALTITUDE = 20.0
+    CRUISE_SPEED = 10.0
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.x = 0.0
+        self.alt = 0.0
+        self.last_t = 0.0
+
+    def phase(self, t):
+        start = 0.0
+        for name, fraction in self.PHASES:
+            end = start + fraction * self.duration
+            if t < end:
+                return name, (t - start) / (end - start)
+            start = end
+        return self.PHASES[-1][0], 1.0
+
+    def state(self, t):
+        name, progress = self.phase(t)
+        dt = t - self.last_t
+        self.last_t = t
+        vx = vz = 0.0
+        if name == "climb":
+            vz = -self.ALTITUDE / (0.1 * self.duration)
+        elif name == "descent":
+            vz = self.ALTITUDE / (0.1 * self.duration)
+        elif name == "cruise":
+            # accelerate and decelerate smoothly
+            vx = self.CRUISE_SPEED * math.sin(math.pi * progress)
+        self.x += vx * dt
+        self.alt -= vz * dt
+        wobble = 0.05 * math.sin(2.0 * t)
+        roll = wobble + 0.02 * math.sin(7.0 * t)
+        pitch = -0.2 * vx / self.CRUISE_SPEED + wobble
+        yaw = 0.3 * math.sin(0.05 * t)
+        return {
+            "pos": (self.x, 0.1 * math.sin(0.3 * t), -self.alt),
+            "vel": (vx, 0.03 * math.cos(0.3 * t), vz),
+            "rpy": (roll, pitch, yaw),
+            "rates": (0.1 * math.cos(2.0 * t) + 0.14 * math.cos(7.0 * t), 0.1 * math.cos(2.0 * t), 0.015 * math.cos(0.05 * t)),
+        }
+
+class SDLog2Writer(object):
+    def __init__(self, f):
+        self.f = f
+        self.msg_descrs = {}    # (type, struct, mults) by message name
+        self.bytes_written = 0
+        self.records = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.bytes_written += len(data)
+
+    def header(self, msg_type):
+        return struct.pack("BBB", SDLog2Parser.MSG_HEAD1, SDLog2Parser.MSG_HEAD2, msg_type)
+
+    def add_format(self, msg_name, msg_format, msg_labels):
+        msg_type = len(self.msg_descrs) + 1
+        msg_struct = "<" + "".join(SDLog2Parser.FORMAT_TO_STRUCT[c][0] for c in msg_format)
+        msg_mults = [SDLog2Parser.FORMAT_TO_STRUCT[c][1] for c in msg_format]
+        msg_length = SDLog2Parser.MSG_HEADER_LEN + struct.calcsize(msg_struct)
+        self.msg_descrs[msg_name] = (msg_type, msg_struct, msg_mults)
+        self.write(self.header(SDLog2Parser.MSG_TYPE_FORMAT) + struct.pack(SDLog2Parser.MSG_FORMAT_STRUCT,
+                   msg_type, msg_length, msg_name.encode("ascii"), msg_format.encode("ascii"), msg_labels.encode("ascii")))
+
+    def add_msg(self, msg_name, values):
+        msg_type, msg_struct, msg_mults = self.msg_descrs[msg_name]
+        data = []
+        for v, m in zip(values, msg_mults):
+            if m != None:
+                v = int(round(v / m))
+            elif isinstance(v, str):
+                v = v.encode("ascii")
+            data.append(v)
+        self.write(self.header(msg_type) + struct.pack(msg_struct, *data))
+        self.records += 1
+
+def generate(f, size, rates=DEFAULT_RATES, corruption=0.0, seed=0):
+    """Write a log of about size bytes to the binary file f, returns the number of records"""
+    rnd = random.Random(seed)
+    writer = SDLog2Writer(f)
+    for msg_name, msg_format, msg_labels in MESSAGES:
+        writer.add_format(msg_name, msg_format, msg_labels)
+    # estimate the duration from the expected bytes per TIME step
+    step_size = 11
+    for msg_name, msg_format, msg_labels in MESSAGES[1:]:
+        step_size += rates.get(msg_name, 0) * (3 + struct.calcsize(writer.msg_descrs[msg_name][1]))
+    steps = max(int(size / (step_size * (1 + 8 * corruption))), 1)
+    profile = FlightProfile(steps * TIME_STEP / 1e6)
+    for i in range(steps):
+        t = i * TIME_STEP / 1e6
+        s = profile.state(t)
+        writer.add_msg("TIME", [1000000 + i * TIME_STEP])
+        if rnd.random() < rates.get("ATT", 0):
+            q = rpy_to_quat(*s["rpy"])
+            writer.add_msg("ATT", q + list(s["rpy"]) + list(s["rates"]) + [0.0, 0.0, 0.0])
+        if rnd.random() < rates.get("LPOS", 0):
+            writer.add_msg("LPOS", list(s["pos"]) + [0.0, 0.0] + list(s["vel"]) + [47.397742, 8.545594, 488.0, 1, 1, 1, 0.5, 0.8])
+        if rnd.random() < rates.get("ATSP", 0):
+            roll, pitch, yaw = s["rpy"]
+            roll_sp, pitch_sp, yaw_sp = roll + 0.01 * rnd.gauss(0, 1), pitch + 0.01 * rnd.gauss(0, 1), yaw
+            writer.add_msg("ATSP", [roll_sp, pitch_sp, yaw_sp, 0.5] + rpy_to_quat(roll_sp, pitch_sp, yaw_sp))
+        if rnd.random() < rates.get("VER", 0):
+            writer.add_msg("VER", ["PX4FMU_V2", "%040x" % rnd.getrandbits(160)])
+        if rnd.random() < rates.get("TEXT", 0):
+            writer.add_msg("TEXT", ["[sdlog2_gen] synthetic message at %.3f s" % t])
+        if corruption > 0 and rnd.random() < corruption:
+            # garbage without header bytes, so that the parser can resync on the next message
+            writer.write(bytes(bytearray(rnd.choice(range(0, SDLog2Parser.MSG_HEAD1)) for j in range(rnd.randint(1, 16)))))
+    return writer.records
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        print("Usage: python sdlog2_gen.py <log.bin> [-s size] [-m MSG=rate[,MSG=rate...]] [-c corruption] [-r seed]\n")
+        print("\t-s\tApproximate size of the log in MB. Default is 10.\n")
+        print("\t-m MSG=rate[,MSG=rate...]\n\t\tProbability of logging MSG (ATT, LPOS, ATSP, VER, TEXT) per TIME message.\n")
+        print("\t-c\tFraction of messages followed by garbage bytes. Default is 0.\n")
+        print("\t-r\tSeed of the random generator. Default is 0.")
+        return
+    fn = argv[1]
+    size = 10.0
+    rates = dict(DEFAULT_RATES)
+    corruption = 0.0
+    seed = 0
+    opt = None
+    for arg in argv[2:]:
+        if opt != None:
+            if opt == "s":
+                size = float(arg)
+            elif opt == "m":
+                for item in arg.split(","):
+                    msg_name, rate = item.split("=")
+                    rates[msg_name] = float(rate)
+            elif opt == "c":
+                corruption = float(arg)
+            elif opt == "r":
+                seed = int(arg)
+            opt = None
+        elif arg in ("-s", "-m", "-c", "-r"):
+            opt = arg[1]
+    with open(fn, "wb") as f:
+        records = generate(f, int(size * 1024 * 1024), rates, corruption, seed)
+    print("%s: %i records" % (fn, records))
+
+if __name__ == "__main__":
+    _main()
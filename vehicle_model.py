@@ -0,0 +1,104 @@
+# Author: Roman Bapst
+# Description: Vehicle wireframes of the viewers as vertex and edge arrays.
+# All vertices of a model are transformed in one batched operation, for one
+# or many frames at once.
+
+from __future__ import division, print_function
+import numpy as np
+# quat_to_rot_array moved to attitude.py, still importable from here
+from attitude import quat_to_rot_array
+
+__author__ = "Roman Bapst"
+
+class VehicleModel(object):
+    """Wireframe of a vehicle in the body frame (x forward, y right, z down).
+    The edges are drawn as one line: they are chained into a path of vertex
+    indices, with a NaN point wherever the path is not connected."""
+    def __init__(self, name, vertices, edges):
+        self.name = name
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.edges = np.asarray(edges, dtype=np.intp)
+        self.path = self.chain(self.edges, len(self.vertices))
+        # points of the path, the extra vertex is the NaN gap
+        self.points = np.vstack([self.vertices, np.nan * np.ones((1, 3))])[self.path]
+
+    @staticmethod
+    def chain(edges, gap):
+        # vertex indices along the edges, consecutive edges sharing a vertex are connected
+        path = []
+        for a, b in edges:
+            if len(path) and path[-1] == a:
+                path.append(b)
+            elif len(path) and path[-1] == b:
+                path.append(a)
+            else:
+                if len(path):
+                    path.append(gap)
+                path += [a, b]
+        return np.array(path, dtype=np.intp)
+
+    def transform(self, R, position):
+        # path points for rotations R (... x 3 x 3) and positions (... x 3), returns ... x P x 3
+        return np.einsum('...ij,pj->...pi', R, self.points) + np.asarray(position)[..., np.newaxis, :]
+
+def _ring(center, radius, axes=(0, 1), segments=12):
+    # circle around center in the plane of the two given axes, returns vertices and edges
+    angle = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    vertices = np.tile(np.asarray(center, dtype=np.float64), (segments, 1))
+    vertices[:, axes[0]] += radius * np.cos(angle)
+    vertices[:, axes[1]] += radius * np.sin(angle)
+    edges = [(i, (i + 1) % segments) for i in range(segments)]
+    return vertices, edges
+
+def _merge(parts):
+    # concatenate (vertices, edges) parts into one model
+    vertices = []
+    edges = []
+    for part_vertices, part_edges in parts:
+        edges += [(a + len(vertices), b + len(vertices)) for a, b in part_edges]
+        vertices += [tuple(v) for v in part_vertices]
+    return vertices, edges
+
+def multicopter(name, arms, arm_length=0.5, prop_rad=0.1, first_arm=np.pi / 4):
+    # arms with motors and propeller rings, a nose marker and a mast pointing up
+    parts = [([(0, 0, 0), (0.1, 0, 0), (0, 0, -0.1)], [(0, 1), (0, 2)])]
+    for i in range(arms):
+        angle = first_arm + 2 * np.pi * i / arms
+        motor = (arm_length * np.cos(angle), arm_length * np.sin(angle), 0)
+        top = (motor[0], motor[1], -0.1)
+        parts.append(([(0, 0, 0), motor, top], [(0, 1), (1, 2)]))
+        if prop_rad > 0:
+            parts.append(_ring(top, prop_rad))
+    return VehicleModel(name, *_merge(parts))
+
+def fixed_wing(name, rotors=False):
+    # delta wing in the y-z plane with a dorsal fin in x, the orientation of
+    # plot_flight_maneuver.py (nose up for RPY = [0,0,0])
+    parts = [([(0, 0, 0.5), (0, 0.5, -0.5), (0, -0.5, -0.5), (0, 0, 0.7), (0, 0, 0),
+               (0.2, 0, -0.1), (0.2, 0, -0.2), (0, 0, -0.2)],
+              [(0, 1), (1, 2), (2, 0), (0, 3), (3, 4), (4, 5), (5, 6), (6, 7)])]
+    # elevons along the trailing edge
+    parts.append(([(0, 0.45, -0.5), (0, 0.1, -0.5), (0, 0.1, -0.58), (0, 0.45, -0.58)],
+                  [(0, 3), (3, 2), (2, 1)]))
+    parts.append(([(0, -0.45, -0.5), (0, -0.1, -0.5), (0, -0.1, -0.58), (0, -0.45, -0.58)],
+                  [(0, 3), (3, 2), (2, 1)]))
+    if rotors:
+        # quadplane: booms under the wing with four lift rotors, thrust along x
+        for y in (0.3, -0.3):
+            parts.append(([(0.05, y, 0.4), (0.05, y, -0.6)], [(0, 1)]))
+            for z in (0.4, -0.6):
+                parts.append(_ring((0.05, y, z), 0.12, axes=(1, 2)))
+    return VehicleModel(name, *_merge(parts))
+
+MODELS = {
+    'quad': multicopter('quad', 4),
+    'hexa': multicopter('hexa', 6, first_arm=np.pi / 6),
+    'fixedwing': fixed_wing('fixedwing'),
+    'vtol': fixed_wing('vtol', rotors=True),
+}
+
+def get_model(name):
+    try:
+        return MODELS[name]
+    except KeyError:
+        raise ValueError("Unknown vehicle model: %s, available are %s" % (name, ", ".join(sorted(MODELS))))
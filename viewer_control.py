@@ -0,0 +1,130 @@
+# Author: Roman Bapst
+# Description: Console, socket and keyboard control of the viewers. Commands
+# are queued by the input threads and executed by the render loop only.
+
+from __future__ import division, print_function
+from collections import deque
+import socket,sys,threading,time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+__author__ = "Roman Bapst"
+
+# figure keys and the console commands they stand for
+KEY_COMMANDS = {
+    'p': 'p',
+    'r': 'r',
+    '+': '+',
+    '-': '-',
+    'right': '+',
+    'left': '-',
+    't': 'time',
+    'f': 'rtf',
+    'n': 'segment next',
+    'b': 'segment prev',
+}
+
+class CommandQueue(object):
+    """Thread-safe queue of (command, reply) pairs, reply(text) sends the
+    answer back to where the command came from"""
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def put(self, command, reply=print):
+        command = command.strip()
+        if command:
+            self.queue.put((command, reply))
+
+    def drain(self):
+        # all pending commands, never blocks
+        while True:
+            try:
+                yield self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def read_stdin(self):
+        self.start_thread(self._stdin_loop)
+
+    def _stdin_loop(self):
+        while True:
+            line = sys.stdin.readline()
+            if not line:
+                return
+            self.put(line)
+
+    def listen(self, port):
+        # accept commands line by line on a local tcp port, e.g. with: nc localhost <port>
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('127.0.0.1', port))
+        server.listen(4)
+        self.start_thread(self._accept_loop, server)
+        return server
+
+    def _accept_loop(self, server):
+        while True:
+            conn, addr = server.accept()
+            self.start_thread(self._socket_loop, conn)
+
+    def _socket_loop(self, conn):
+        def reply(text):
+            try:
+                conn.sendall((str(text) + '\n').encode('utf-8'))
+            except socket.error:
+                pass
+        f = conn.makefile('r')
+        try:
+            for line in f:
+                self.put(line, reply)
+        finally:
+            f.close()
+            conn.close()
+
+    def connect_figure(self, fig, key_commands=KEY_COMMANDS):
+        # don't let the default navigation keys (e.g. 'p' for pan) act on our keys as well. Only the
+        # default handler of this figure is replaced, the keymap rcParams of other figures stay as they are.
+        manager = fig.canvas.manager
+        if getattr(manager, 'key_press_handler_id', None) is not None:
+            from matplotlib.backend_bases import key_press_handler
+            def default_keys(event):
+                if event.key not in key_commands:
+                    key_press_handler(event, fig.canvas, manager.toolbar)
+            fig.canvas.mpl_disconnect(manager.key_press_handler_id)
+            manager.key_press_handler_id = fig.canvas.mpl_connect('key_press_event', default_keys)
+        def on_key(event):
+            command = key_commands.get(event.key)
+            if command is not None:
+                self.put(command)
+        fig.canvas.mpl_connect('key_press_event', on_key)
+
+class RateMeter(object):
+    """Frame rate and real time factor measured over the last window seconds"""
+    def __init__(self, window=2.0):
+        self.window = window
+        self.samples = deque()    # (wall time, log time [s])
+
+    def update(self, log_time):
+        now = time.time()
+        self.samples.append((now, log_time))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+    def fps(self):
+        if len(self.samples) < 2:
+            return 0.0
+        return (len(self.samples) - 1) / (self.samples[-1][0] - self.samples[0][0])
+
+    def rtf(self):
+        if len(self.samples) < 2:
+            return 0.0
+        return (self.samples[-1][1] - self.samples[0][1]) / (self.samples[-1][0] - self.samples[0][0])